@@ -0,0 +1,140 @@
+"""
+Former forecast engines, no longer used by the app, kept as baselines
+that the benchmarks check the app's engines against.
+"""
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from forecast import forecast_plans, tons_per_heat
+from models import Grade, GradeRatio, Group, MonthlyBreakdown, MonthlyGroupPlan
+
+
+def forecast_heats(db: Session) -> dict:
+    """
+    Forecast the production of heats at grade level for the last planned
+    month of each group, if it has no production breakdown yet. The mean
+    ratio of each grade, read from the 'grade_ratios' table, is applied to
+    the planned group production for the forecasted month.
+    """
+
+    plans = forecast_plans(db)
+    ratios = db.execute(
+        select(
+            Grade.group_id,
+            Grade.name,
+            GradeRatio.ratio_sum,
+            GradeRatio.ratio_count,
+            tons_per_heat,
+        )
+        .join(GradeRatio, GradeRatio.grade_id == Grade.id)
+        .where(Grade.group_id.in_([group_id for group_id, *_ in plans]))
+        .order_by(Grade.id)
+    ).all()
+
+    heats = {group_id: heats_per_month for group_id, _, _, heats_per_month in plans}
+    forecasts = {
+        group_id: {
+            "forecast_month": forecast_month.strftime("%Y-%m"),
+            "units": "heats",
+            "forecast": {},
+        }
+        for group_id, _, forecast_month, _ in plans
+    }
+    for group_id, grade_name, ratio_sum, ratio_count, grade_tons in ratios:
+        if ratio_count:
+            mean_ratio = ratio_sum / ratio_count / grade_tons
+            forecast = int(round(mean_ratio * heats[group_id]))
+        else:
+            forecast = None
+        forecasts[group_id]["forecast"][grade_name] = forecast
+    return {group_name: forecasts[group_id] for group_id, group_name, *_ in plans}
+
+
+def load_history(db: Session) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Load the production history in two queries: the monthly breakdown
+    of the grades that belong to a group, with columns
+    ["month", "grade_id", "grade", "group_id", "tons", "tons_per_heat"],
+    and the monthly group plans, with columns ["month", "group_id",
+    "group", "heats"].
+    """
+    breakdown = pd.read_sql(
+        select(
+            MonthlyBreakdown.month,
+            MonthlyBreakdown.grade_id,
+            Grade.name.label("grade"),
+            Grade.group_id,
+            MonthlyBreakdown.tons,
+            tons_per_heat.label("tons_per_heat"),
+        )
+        .join(Grade, Grade.id == MonthlyBreakdown.grade_id)
+        .where(Grade.group_id.is_not(None))
+        .order_by(MonthlyBreakdown.month, MonthlyBreakdown.grade_id),
+        db.connection(),
+    )
+    plans = pd.read_sql(
+        select(
+            MonthlyGroupPlan.month,
+            MonthlyGroupPlan.group_id,
+            Group.name.label("group"),
+            MonthlyGroupPlan.heats,
+        )
+        .join(Group, Group.id == MonthlyGroupPlan.group_id)
+        .order_by(MonthlyGroupPlan.month, MonthlyGroupPlan.group_id),
+        db.connection(),
+    )
+    return breakdown, plans
+
+
+def forecast_from_history(breakdown: pd.DataFrame, plans: pd.DataFrame) -> dict:
+    """
+    Vectorized forecast over the full production history, as returned
+    by `load_history`. The mean ratio of each grade is computed with a
+    single merge and groupby, and applied to the planned group production
+    for the last planned month of each group without a breakdown. Returns
+    the same result as `forecast_heats`.
+    """
+
+    # ratio of each grade to the plan of its group, in heats
+    history = breakdown.merge(plans, on=["month", "group_id"], how="left")
+    heats = history["heats"].where(history["heats"] > 0)
+    history["ratio"] = history["tons"] / history["tons_per_heat"] / heats
+    grades = history.groupby(["group_id", "grade_id", "grade"], sort=True)
+    ratios = grades["ratio"].mean().reset_index()
+
+    # the forecast month of each group is its last planned month, if the
+    # grades of the group don't have a breakdown for it yet
+    last_plans = plans.sort_values("month").groupby("group_id").tail(1)
+    last_plans = last_plans.merge(
+        breakdown[["month", "group_id"]].drop_duplicates(),
+        on=["month", "group_id"],
+        how="left",
+        indicator=True,
+    )
+    last_plans = last_plans[last_plans["_merge"] == "left_only"]
+    last_plans = last_plans.sort_values("group_id")
+
+    ratios = ratios.merge(last_plans[["group_id", "heats"]], on="group_id")
+    ratios["forecast"] = np.rint(ratios["ratio"] * ratios["heats"])
+
+    forecasts = {
+        group_id: {
+            "forecast_month": month.strftime("%Y-%m"),
+            "units": "heats",
+            "forecast": {},
+        }
+        for group_id, month in zip(last_plans["group_id"], last_plans["month"])
+    }
+    for group_id, grade, forecast in zip(
+        ratios["group_id"], ratios["grade"], ratios["forecast"]
+    ):
+        forecasts[group_id]["forecast"][grade] = (
+            None if np.isnan(forecast) else int(forecast)
+        )
+    return {
+        group: forecasts[group_id]
+        for group_id, group in zip(last_plans["group_id"], last_plans["group"])
+    }
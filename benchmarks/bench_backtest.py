@@ -0,0 +1,84 @@
+"""
+Check that the one-pass backtest of the forecast agrees with re-running
+the forecast on the history before each month, and benchmark it.
+
+Usage:
+    python -m benchmarks.bench_backtest --grades 1000 --months 120
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from dimensions import get_dimensions
+from forecast import backtest_errors, backtest_forecast, load_grade_history
+from parsers import MonthlyGroupParser, SteelProductionParser
+
+from benchmarks.baselines import forecast_from_history, load_history
+from benchmarks.common import temp_session
+from benchmarks.generators import monthly_group_workbook, steel_production_workbook
+
+
+def per_month_forecasts(breakdown: pd.DataFrame, plans: pd.DataFrame) -> dict:
+    """
+    The forecast of each grade and month, by running the forecast on a
+    snapshot of the history up to each month, as a baseline.
+    """
+    forecasts = {}
+    for month in sorted(breakdown["month"].unique()):
+        result = forecast_from_history(
+            breakdown[breakdown["month"] < month], plans[plans["month"] <= month]
+        )
+        for group in result.values():
+            if group["forecast_month"] != month.strftime("%Y-%m"):
+                continue
+            for grade, forecast in group["forecast"].items():
+                if forecast is not None:
+                    forecasts[month.isoformat(), grade] = forecast
+    return forecasts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--grades", type=int, default=1000)
+    parser.add_argument("--months", type=int, default=120)
+    parser.add_argument(
+        "--skip-check", action="store_true", help="don't run the per-month baseline"
+    )
+    args = parser.parse_args()
+
+    with temp_session() as db:
+        SteelProductionParser(
+            steel_production_workbook(args.months, args.groups, args.grades), db
+        )()
+        MonthlyGroupParser(monthly_group_workbook(args.months, args.groups), db)()
+
+        start = time.perf_counter()
+        result = backtest_forecast(db)
+        elapsed = time.perf_counter() - start
+        print(
+            f"one-pass backtest: {elapsed * 1000:8.1f} ms for {result['forecasts']} "
+            f"forecasts over {result['months']} months, MAE {result['mae']} heats"
+        )
+
+        if not args.skip_check:
+            breakdown, plans = load_history(db)
+            start = time.perf_counter()
+            expected = per_month_forecasts(breakdown, plans)
+            elapsed = time.perf_counter() - start
+            errors = backtest_errors(load_grade_history(db))
+            grade_names = get_dimensions(db).grade_names
+            got = {
+                (month, grade_names[grade_id]): int(forecast)
+                for month, grade_id, forecast in zip(
+                    errors["month"], errors["grade_id"], errors["forecast"]
+                )
+            }
+            assert got == expected, "backtest differs from the per-month forecasts"
+            print(f"per-month forecast: {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
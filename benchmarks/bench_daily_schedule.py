@@ -0,0 +1,75 @@
+"""
+Benchmark `DailyScheduleParser._add_to_db` against the original
+row-by-row implementation (one SELECT per grade, one SELECT per heat
+and one commit per row).
+
+Usage:
+    python -m benchmarks.bench_daily_schedule --days 90 --heats-per-day 24
+"""
+
+import argparse
+
+from models import DailySchedule, Grade
+from parsers import DailyScheduleParser
+
+from benchmarks.common import temp_session, timed
+from benchmarks.generators import daily_schedule_workbook
+
+
+def legacy_add_to_db(parser: DailyScheduleParser):
+    """The original `iterrows()` implementation, kept as a baseline."""
+    db = parser.db
+    for _, row in parser.df.iterrows():
+        grade_name = row["Grade"].strip()
+        grade = db.query(Grade).filter_by(name=grade_name).first()
+        if not grade:
+            grade = Grade(name=grade_name)
+            db.add(grade)
+            db.commit()
+        schedule = (
+            db.query(DailySchedule)
+            .filter_by(date=row["Date"], time_start=row["Start time"])
+            .first()
+        )
+        if schedule:
+            schedule.grade_id = grade.id
+            schedule.mould_size = row["Mould size"].strip()
+        else:
+            schedule = DailySchedule(
+                date=row["Date"],
+                time_start=row["Start time"],
+                grade_id=grade.id,
+                mould_size=row["Mould size"].strip(),
+            )
+            db.add(schedule)
+        db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--heats-per-day", type=int, default=24)
+    parser.add_argument("--grades", type=int, default=50)
+    args = parser.parse_args()
+
+    contents = daily_schedule_workbook(args.days, args.heats_per_day, args.grades)
+    for name, add_to_db in [
+        ("legacy", legacy_add_to_db),
+        ("bulk", DailyScheduleParser._add_to_db),
+    ]:
+        with temp_session() as db:
+            schedule_parser = DailyScheduleParser(contents, db)
+            schedule_parser._read_excel()
+            n_rows = len(schedule_parser.df)
+            insert_time = timed(add_to_db, schedule_parser)
+            # a second pass over the same rows exercises the update path
+            update_time = timed(add_to_db, schedule_parser)
+        print(
+            f"{name:>6}: {n_rows} rows | "
+            f"insert {n_rows / insert_time:,.0f} rows/s | "
+            f"update {n_rows / update_time:,.0f} rows/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
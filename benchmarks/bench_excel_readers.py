@@ -0,0 +1,95 @@
+"""
+Compare the parse time and peak memory of the Excel engines supported by
+`readers.read_excel`, on the workbooks of `input_files/archive.zip` and on
+synthetic workbooks at plant scale. Each measurement runs in a fresh
+process, so that the peak RSS is not shared between engines.
+
+Usage:
+    python -m benchmarks.bench_excel_readers --days 365 --months 120
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from parsers import DailyScheduleParser, MonthlyGroupParser, SteelProductionParser
+import readers
+from readers import EXCEL_ENGINES
+
+from benchmarks.generators import (
+    daily_schedule_workbook,
+    monthly_group_workbook,
+    steel_production_workbook,
+)
+
+PARSERS = {
+    "daily_charge_schedule": DailyScheduleParser,
+    "product_groups_monthly": MonthlyGroupParser,
+    "steel_grade_production": SteelProductionParser,
+}
+
+
+def _parse(engine: str, parser_cls, contents: bytes):
+    """Parse a workbook, returning the DataFrame, time and peak RSS in MB."""
+    readers.EXCEL_ENGINE = engine
+    start = time.perf_counter()
+    parser = parser_cls(contents, None)
+    parser._read_excel()
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return parser.df, elapsed, peak_rss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--archive", default="input_files/archive.zip")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--months", type=int, default=120)
+    parser.add_argument("--grades", type=int, default=1000)
+    args = parser.parse_args()
+
+    workbooks = []
+    with zipfile.ZipFile(args.archive) as archive:
+        for name in archive.namelist():
+            parser_cls = next(p for key, p in PARSERS.items() if key in name)
+            workbooks.append((name, parser_cls, archive.read(name)))
+    workbooks += [
+        (
+            f"synthetic daily schedule ({args.days} days)",
+            DailyScheduleParser,
+            daily_schedule_workbook(args.days),
+        ),
+        (
+            f"synthetic group plan ({args.months} months)",
+            MonthlyGroupParser,
+            monthly_group_workbook(args.months),
+        ),
+        (
+            f"synthetic breakdown ({args.grades} grades x {args.months} months)",
+            SteelProductionParser,
+            steel_production_workbook(args.months, n_grades=args.grades),
+        ),
+    ]
+
+    context = multiprocessing.get_context("spawn")
+    for name, parser_cls, contents in workbooks:
+        print(f"{name} ({len(contents) / 1024:.0f} kB)")
+        frames = []
+        for engine in EXCEL_ENGINES:
+            with ProcessPoolExecutor(1, mp_context=context) as pool:
+                df, elapsed, peak_rss = pool.submit(
+                    _parse, engine, parser_cls, contents
+                ).result()
+            frames.append(df)
+            print(f"  {engine:>9}: {elapsed:7.3f} s | peak RSS {peak_rss:6.0f} MB")
+        for df in frames[1:]:
+            pd.testing.assert_frame_equal(df, frames[0])
+
+
+if __name__ == "__main__":
+    main()
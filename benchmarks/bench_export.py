@@ -0,0 +1,102 @@
+"""
+Compare the time to fetch the production tables and rebuild them as a
+DataFrame client-side, from the nested JSON responses and from the `arrow`
+and `parquet` formats, through FastAPI's `TestClient` on a temporary
+SQLite database.
+
+Usage:
+    python -m benchmarks.bench_export --days 1095 --grades 1000 --months 120
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from io import BytesIO
+
+import pandas as pd
+import pyarrow as pa
+
+from benchmarks.generators import (
+    daily_schedule_workbook,
+    monthly_group_workbook,
+    steel_production_workbook,
+)
+
+
+def from_json(client, path: str) -> pd.DataFrame:
+    """Rebuild the table from its nested JSON, as the analysts did."""
+    data = client.get(path).json()
+    if path == "/daily_schedules":
+        records = [
+            {"date": day, **heat} for day, heats in data.items() for heat in heats
+        ]
+        df = pd.DataFrame.from_records(records)
+        df["date"] = pd.to_datetime(df["date"])
+    else:
+        records = [
+            {"month": month, **row} for month, rows in data.items() for row in rows
+        ]
+        df = pd.DataFrame.from_records(records)
+        df["month"] = pd.to_datetime(df["month"])
+    return df
+
+
+def from_arrow(client, path: str) -> pd.DataFrame:
+    content = client.get(path, params={"format": "arrow"}).content
+    with pa.ipc.open_stream(pa.py_buffer(content)) as reader:
+        return reader.read_all().to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def from_parquet(client, path: str) -> pd.DataFrame:
+    content = client.get(path, params={"format": "parquet"}).content
+    return pd.read_parquet(BytesIO(content), dtype_backend="pyarrow")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=1095)
+    parser.add_argument("--heats-per-day", type=int, default=24)
+    parser.add_argument("--grades", type=int, default=1000)
+    parser.add_argument("--months", type=int, default=120)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # the app creates its engines on import, from the environment
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+        from fastapi.testclient import TestClient
+
+        import main as app_main
+
+        files = [
+            (
+                "steel_grade_production.xlsx",
+                steel_production_workbook(args.months, n_grades=args.grades),
+            ),
+            ("product_groups_monthly.xlsx", monthly_group_workbook(args.months)),
+            (
+                "daily_charge_schedule.xlsx",
+                daily_schedule_workbook(args.days, args.heats_per_day, args.grades),
+            ),
+        ]
+        with TestClient(app_main.app) as client:
+            response = client.post(
+                "/upload/batch", files=[("files", file) for file in files]
+            )
+            response.raise_for_status()
+            for path in ["/daily_schedules", "/monthly_breakdown"]:
+                for name, fetch in [
+                    ("json", from_json),
+                    ("arrow", from_arrow),
+                    ("parquet", from_parquet),
+                ]:
+                    # bypass the response cache, to time the query too
+                    app_main.response_cache.bump()
+                    start = time.perf_counter()
+                    df = fetch(client, path)
+                    seconds = time.perf_counter() - start
+                    print(f"{path} {name:>7}: {len(df)} rows in {seconds:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
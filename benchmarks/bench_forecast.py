@@ -0,0 +1,45 @@
+"""
+Benchmark the latency of the forecast as the production history grows.
+
+Usage:
+    python -m benchmarks.bench_forecast --grades 300 --months 12 60 120 240
+"""
+
+import argparse
+import timeit
+
+from cache import response_cache
+from forecasters import forecast_with
+from parsers import MonthlyGroupParser, SteelProductionParser
+
+from benchmarks.common import temp_session
+from benchmarks.generators import monthly_group_workbook, steel_production_workbook
+
+
+def forecast(db) -> dict:
+    """The forecast of `/forecast`, fitting its model again."""
+    response_cache.bump()
+    return forecast_with(db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--grades", type=int, default=300)
+    parser.add_argument("--months", type=int, nargs="+", default=[12, 60, 120, 240])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for months in args.months:
+        with temp_session() as db:
+            # plans cover one more month than the breakdown, to be forecasted
+            SteelProductionParser(
+                steel_production_workbook(months, args.groups, args.grades), db
+            )()
+            MonthlyGroupParser(monthly_group_workbook(months + 1, args.groups), db)()
+            seconds = timeit.timeit(lambda: forecast(db), number=args.repeat)
+        print(f"{months:>4} months: forecast {seconds / args.repeat * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
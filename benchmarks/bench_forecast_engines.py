@@ -0,0 +1,108 @@
+"""
+Check that the forecast engines, the former ones and the "mean" model of
+`/forecast`, agree with the original per-group ORM loop, and benchmark
+them.
+
+Usage:
+    python -m benchmarks.bench_forecast_engines --grades 1000 --months 120
+"""
+
+import argparse
+import json
+import time
+
+from forecasters import forecast_with
+from models import Grade, Group, MonthlyBreakdown, MonthlyGroupPlan
+from parsers import MonthlyGroupParser, SteelProductionParser
+
+from benchmarks.baselines import forecast_from_history, forecast_heats, load_history
+from benchmarks.common import temp_session
+from benchmarks.generators import monthly_group_workbook, steel_production_workbook
+
+
+def legacy_forecast(db) -> dict:
+    """The original per-group ORM loop of `/forecast`, kept as a baseline."""
+    groups = db.query(Group).all()
+    forecasts = {}
+    for group in groups:
+        grades = db.query(Grade).filter_by(group=group)
+        grades = grades.filter(Grade.tons != None).all()  # noqa: E711
+        grade_ids = [grade.id for grade in grades]
+        breakdowns = (
+            db.query(MonthlyBreakdown)
+            .filter(MonthlyBreakdown.grade_id.in_(grade_ids))
+            .order_by(MonthlyBreakdown.month)
+            .all()
+        )
+        plans = (
+            db.query(MonthlyGroupPlan)
+            .filter_by(group_id=group.id)
+            .order_by(MonthlyGroupPlan.month)
+            .all()
+        )
+        group_heats_by_month = {plan.month: plan.heats for plan in plans}
+        grade_heats_by_month = {}
+        for b in breakdowns:
+            if b.month not in grade_heats_by_month:
+                grade_heats_by_month[b.month] = {}
+            grade_heats_by_month[b.month][b.grade_id] = b.tons / 100
+        mean_ratios = {}
+        for grade in grades:
+            ratios = []
+            for month, heats_by_grade in grade_heats_by_month.items():
+                if grade.id in heats_by_grade and month in group_heats_by_month:
+                    heats = group_heats_by_month[month]
+                    if heats and heats > 0:
+                        ratios.append(heats_by_grade[grade.id] / heats)
+            mean_ratios[grade.id] = sum(ratios) / len(ratios) if ratios else None
+        forecast_month = list(group_heats_by_month.keys())[-1]
+        if forecast_month in grade_heats_by_month.keys():
+            continue
+        heats_per_month = group_heats_by_month[forecast_month]
+        forecast = {}
+        for grade in grades:
+            ratio = mean_ratios[grade.id]
+            if ratio is not None:
+                forecast[grade.name] = int(round(ratio * heats_per_month))
+            else:
+                forecast[grade.name] = None
+        forecasts[group.name] = {
+            "forecast_month": forecast_month.strftime("%Y-%m"),
+            "units": "heats",
+            "forecast": forecast,
+        }
+    return forecasts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--grades", type=int, default=1000)
+    parser.add_argument("--months", type=int, default=120)
+    args = parser.parse_args()
+
+    engines = {
+        "legacy ORM loop": legacy_forecast,
+        "vectorized history": lambda db: forecast_from_history(*load_history(db)),
+        "grade_ratios table": forecast_heats,
+        "mean model": forecast_with,
+    }
+    with temp_session() as db:
+        SteelProductionParser(
+            steel_production_workbook(args.months, args.groups, args.grades), db
+        )()
+        MonthlyGroupParser(monthly_group_workbook(args.months + 1, args.groups), db)()
+
+        expected = None
+        for name, engine in engines.items():
+            start = time.perf_counter()
+            result = engine(db)
+            elapsed = time.perf_counter() - start
+            if expected is None:
+                expected = result
+            assert json.dumps(result) == json.dumps(expected), name
+            print(f"{name:>20}: {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
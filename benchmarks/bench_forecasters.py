@@ -0,0 +1,71 @@
+"""
+Benchmark the fit and predict time of each forecasting model, and check
+that the mean ratio fitted on the history matrix agrees with the one read
+from the 'grade_ratios' table.
+
+Usage:
+    python -m benchmarks.bench_forecasters --grades 1000 --months 120
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from forecasters import FORECASTERS, MeanRatio, load_ratio_history
+from parsers import MonthlyGroupParser, SteelProductionParser
+
+from benchmarks.common import temp_session, timed
+from benchmarks.generators import monthly_group_workbook, steel_production_workbook
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--grades", type=int, default=1000)
+    parser.add_argument("--months", type=int, default=120)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with temp_session() as db:
+        SteelProductionParser(
+            steel_production_workbook(args.months, args.groups, args.grades), db
+        )()
+        MonthlyGroupParser(monthly_group_workbook(args.months + 1, args.groups), db)()
+
+        start = time.perf_counter()
+        history = load_ratio_history(db)
+        load = time.perf_counter() - start
+        print(
+            f"load history: {load * 1000:.1f} ms for a "
+            f"{history.ratios.shape[0]} x {history.ratios.shape[1]} matrix"
+        )
+
+        table = MeanRatio().fit(db)
+        assert np.array_equal(table.grade_ids, history.grade_ids)
+        assert np.allclose(
+            table.params, MeanRatio().fit_history(history), equal_nan=True
+        ), "mean ratios differ from the 'grade_ratios' table"
+        table_fit = sum(timed(MeanRatio().fit, db) for _ in range(args.repeat))
+        table_fit /= args.repeat
+        print(f"{'mean (table)':>14}: fit {table_fit * 1000:8.2f} ms")
+
+        # forecast the month after the history for every grade
+        months = np.full(len(history.grade_ids), history.months[-1] + 1)
+        heats = np.full(len(history.grade_ids), 100.0)
+        for name, forecaster in FORECASTERS.items():
+            fit = timed(forecaster.fit_history, history)
+            fitted = forecaster.fit(db)
+            predict = sum(
+                timed(forecaster.predict, fitted, months, heats)
+                for _ in range(args.repeat)
+            )
+            predict /= args.repeat
+            print(
+                f"{name:>14}: fit {fit * 1000:8.2f} ms, "
+                f"predict {predict * 1000:8.3f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
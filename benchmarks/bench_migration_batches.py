@@ -0,0 +1,99 @@
+"""
+Benchmark how long a data migration over a large 'daily_schedule' table
+blocks other writers, run as a single statement or in batches.
+
+Usage:
+    python -m benchmarks.bench_migration_batches --rows 2000000 --batch-size 50000
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import text
+
+from engine import create_db_engine
+from migrations.batching import execute_in_batches
+from models import Base
+
+FILL_SQL = """
+WITH RECURSIVE heats(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM heats WHERE i < :rows - 1)
+INSERT INTO daily_schedule (date, time_start, grade_id, mould_size)
+SELECT date('2000-01-01', '+' || (i / 96) || ' days'),
+       time('00:00', '+' || (i % 96 * 15) || ' minutes'),
+       1,
+       '6 1/4"'
+FROM heats
+"""
+
+MIGRATION_SQL = """
+UPDATE daily_schedule SET mould_size = upper(mould_size)
+WHERE id >= :start AND id < :end
+"""
+
+
+def writer(engine, stop: threading.Event, waits: list):
+    """Write small transactions until stopped, recording how long each took."""
+    with engine.connect() as connection:
+        while not stop.is_set():
+            start = time.perf_counter()
+            connection.execute(
+                text(
+                    "INSERT INTO uploads (parser, filename, content_hash, rows_written) "
+                    "VALUES ('bench', 'bench.xlsx', '', 0)"
+                )
+            )
+            connection.commit()
+            waits.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+
+def run(rows: int, batch_size: int) -> tuple[float, float, int]:
+    """Migrate a table of `rows` rows, returning the duration and the longest write."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine = create_db_engine(f"sqlite:///{os.path.join(tmpdir, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO grades (name) VALUES ('G0000')"))
+            connection.execute(text(FILL_SQL), {"rows": rows})
+
+        stop, waits = threading.Event(), []
+        thread = threading.Thread(target=writer, args=(engine, stop, waits))
+        thread.start()
+        time.sleep(0.2)
+        start = time.perf_counter()
+        with engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as connection:
+            batches = execute_in_batches(
+                connection, MIGRATION_SQL, "daily_schedule", batch_size
+            )
+        seconds = time.perf_counter() - start
+        time.sleep(0.2)
+        stop.set()
+        thread.join()
+        engine.dispose()
+    return seconds, max(waits), batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    args = parser.parse_args()
+
+    for label, batch_size in [
+        ("single statement", args.rows),
+        (f"batches of {args.batch_size}", args.batch_size),
+    ]:
+        seconds, longest_write, batches = run(args.rows, batch_size)
+        print(
+            f"{label:>22}: migration {seconds:.2f} s in {batches} transactions, "
+            f"longest concurrent write {longest_write * 1000:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
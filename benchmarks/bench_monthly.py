@@ -0,0 +1,47 @@
+"""
+Benchmark the ingestion of monthly workbooks by `SteelProductionParser`
+and `MonthlyGroupParser`.
+
+Usage:
+    python -m benchmarks.bench_monthly --months 60 --groups 10 --grades 300
+"""
+
+import argparse
+
+from parsers import MonthlyGroupParser, SteelProductionParser
+
+from benchmarks.common import temp_session, timed
+from benchmarks.generators import monthly_group_workbook, steel_production_workbook
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--months", type=int, default=60)
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--grades", type=int, default=300)
+    args = parser.parse_args()
+
+    workbooks = [
+        (
+            SteelProductionParser,
+            steel_production_workbook(args.months, args.groups, args.grades),
+        ),
+        (MonthlyGroupParser, monthly_group_workbook(args.months, args.groups)),
+    ]
+    with temp_session() as db:
+        for parser_cls, contents in workbooks:
+            file_parser = parser_cls(contents, db)
+            read_time = timed(file_parser._read_excel)
+            n_cells = file_parser.df.size
+            insert_time = timed(file_parser._add_to_db)
+            update_time = timed(file_parser._add_to_db)
+            print(
+                f"{parser_cls.__name__}: {n_cells} cells | "
+                f"read {read_time:.3f}s | "
+                f"insert {insert_time:.3f}s | "
+                f"update {update_time:.3f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Check that the heavy read endpoints neither crash the server nor block
+its event loop.
+
+Serves the app with uvicorn and the uvloop event loop, as in production,
+on a temporary SQLite database filled with synthetic workbooks. Each
+endpoint is then requested while a probe keeps requesting a light async
+endpoint: the check fails if the server dies, if an endpoint doesn't
+respond with a 200, or if the probe waits longer than `--max-stall`
+seconds, i.e. the endpoint ran its CPU-bound work on the event loop.
+Exits with status 1 on failure, so it can run in CI.
+
+Usage:
+    python -m benchmarks.check_event_loop --grades 1000 --months 120
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+from benchmarks.generators import (
+    daily_schedule_workbook,
+    monthly_group_workbook,
+    steel_production_workbook,
+)
+
+ENDPOINTS = [
+    "/forecast",
+    "/forecast?model=ewma",
+    "/forecast?model=seasonal",
+    "/forecast?horizon=3",
+    "/forecast/backtest",
+    "/daily_schedules",
+    "/daily_schedules/rollup",
+    "/monthly_plans",
+    "/monthly_breakdown",
+]
+
+# a light async endpoint, served on the event loop
+PROBE = "/jobs/probe"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(database_url: str, port: int) -> subprocess.Popen:
+    """Serve the app with uvicorn and uvloop, and wait until it is up."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--loop", "uvloop"]
+        + ["--port", str(port), "--log-level", "warning"],
+        cwd=root,
+        env={**os.environ, "DATABASE_URL": database_url},
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with status {server.returncode}.")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}{PROBE}")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("Server not up after 60 s.")
+
+
+def probe(base_url: str, stop: threading.Event, latencies: list):
+    """Request the probe endpoint until stopped, recording its latencies."""
+    with httpx.Client(base_url=base_url, timeout=60) as http:
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                http.get(PROBE)
+            except httpx.TransportError:
+                return
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+
+def check_endpoint(http: httpx.Client, path: str) -> tuple[int | None, float, float]:
+    """
+    Request an endpoint while probing the event loop. Returns its status
+    code (None if the connection failed), its time, and the longest wait
+    of the probe.
+    """
+    latencies = []
+    stop = threading.Event()
+    thread = threading.Thread(target=probe, args=(http.base_url, stop, latencies))
+    thread.start()
+    start = time.perf_counter()
+    try:
+        status = http.get(path).status_code
+    except httpx.TransportError:
+        status = None
+    seconds = time.perf_counter() - start
+    stop.set()
+    thread.join()
+    return status, seconds, max(latencies, default=0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--heats-per-day", type=int, default=24)
+    parser.add_argument("--grades", type=int, default=1000)
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--months", type=int, default=120)
+    parser.add_argument("--max-stall", type=float, default=0.25)
+    args = parser.parse_args()
+
+    files = [
+        (
+            "steel_grade_production.xlsx",
+            steel_production_workbook(args.months, args.groups, args.grades),
+        ),
+        (
+            "product_groups_monthly.xlsx",
+            monthly_group_workbook(args.months + 1, args.groups),
+        ),
+        (
+            "daily_charge_schedule.xlsx",
+            daily_schedule_workbook(args.days, args.heats_per_day, args.grades),
+        ),
+    ]
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database_url = f"sqlite:///{os.path.join(tmpdir, 'check.db')}"
+        port = _free_port()
+        server = start_server(database_url, port)
+        try:
+            with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=300) as http:
+                response = http.post(
+                    "/upload/batch", files=[("files", file) for file in files]
+                )
+                response.raise_for_status()
+                for path in ENDPOINTS:
+                    status, seconds, stall = check_endpoint(http, path)
+                    ok = status == 200 and stall <= args.max_stall
+                    failures += not ok
+                    print(
+                        f"{'ok  ' if ok else 'FAIL'} {path}: status {status}, "
+                        f"{seconds:.2f} s, event loop blocked up to {stall:.3f} s"
+                    )
+                    if server.poll() is not None:
+                        print(f"Server exited with status {server.returncode}.")
+                        failures += 1
+                        break
+        finally:
+            server.terminate()
+            server.wait()
+    print(f"{len(ENDPOINTS)} endpoints checked, {failures} failures")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Check that the queries of the upload and read endpoints use indexes.
+
+Runs the app on a temporary SQLite database created by the migrations,
+uploads synthetic workbooks and calls each read endpoint, capturing the
+SQL they execute. Each statement is then run through `EXPLAIN QUERY PLAN`:
+the check fails if a query scans a whole table without an index, or if
+an endpoint doesn't use the indexes it is expected to. Exits with status
+1 on failure, so it can run in CI.
+
+Usage:
+    python -m benchmarks.check_query_plans --verbose
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+from sqlalchemy import event
+
+from models import Base
+
+from benchmarks.generators import (
+    daily_schedule_workbook,
+    monthly_group_workbook,
+    steel_production_workbook,
+)
+
+# indexes each endpoint must use for at least one of its queries
+EXPECTED_INDEXES = {
+    "/upload/batch": {
+        "ix_uploads_parser",
+        "ix_grades_group_id",
+        "ix_monthly_breakdown_grade_id_month",
+    },
+    "/forecast": {"ix_monthly_group_plan_group_id_month"},
+    "/forecast/backtest": {"ix_monthly_breakdown_grade_id_month"},
+}
+
+# tables an endpoint reads whole by design: fitting a forecasting model
+# reads the ratios of all grades, once per upload
+FULL_READS = {"/forecast": {"grades"}}
+
+ENDPOINTS = [
+    "/forecast",
+    "/forecast/backtest",
+    "/forecast?model=seasonal",
+    "/forecast?horizon=3",
+    "/forecast?months=2024-01,2024-02",
+    "/steel_grades",
+    "/product_groups",
+    "/daily_schedules",
+    "/daily_schedules?start_date=2024-01-15&end_date=2024-01-20",
+    "/daily_schedules?cursor=2024-01-10T12:00&limit=50",
+    "/daily_schedules?format=ndjson",
+    "/daily_schedules/rollup",
+    "/daily_schedules/rollup?start_month=2024-01",
+    "/monthly_plans",
+    "/monthly_breakdown?format=csv",
+]
+
+# a plan step reading a whole table (or subquery), rather than searching or
+# scanning an index
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def capture_statements(database_url: str) -> list[tuple[str, str, tuple]]:
+    """
+    Run the uploads and the read endpoints against the database at
+    `database_url`, and return the (endpoint, statement, parameters) of
+    each query they executed.
+    """
+    # the app reads DATABASE_URL on import
+    os.environ["DATABASE_URL"] = database_url
+    from fastapi.testclient import TestClient
+
+    import engine
+    import main as api
+
+    endpoint = None
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        # bulk inserts and the upsert statements don't read tables
+        if endpoint and not executemany and "SELECT" in statement.upper():
+            statements.append((endpoint, statement, parameters))
+
+    for db_engine in (engine.engine, engine.async_engine.sync_engine):
+        event.listen(db_engine, "before_cursor_execute", capture)
+
+    with TestClient(api.app) as client:
+        endpoint = "/upload/batch"
+        files = [
+            ("steel_grade_production.xlsx", steel_production_workbook(24, 10, 200)),
+            ("product_groups_monthly.xlsx", monthly_group_workbook(25, 10)),
+            ("daily_charge_schedule.xlsx", daily_schedule_workbook(31, 24, 200)),
+        ]
+        response = client.post(
+            "/upload/batch", files=[("files", file) for file in files]
+        )
+        response.raise_for_status()
+        for endpoint in ENDPOINTS:
+            client.get(endpoint).raise_for_status()
+    for db_engine in (engine.engine, engine.async_engine.sync_engine):
+        event.remove(db_engine, "before_cursor_execute", capture)
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--verbose", action="store_true", help="print all plans")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        statements = capture_statements(f"sqlite:///{tmpdir}/plans.db")
+
+        import engine
+
+        failures = []
+        used_indexes = {}
+        with engine.engine.connect() as conn:
+            for endpoint, statement, parameters in statements:
+                plan = [
+                    row[-1]
+                    for row in conn.exec_driver_sql(
+                        f"EXPLAIN QUERY PLAN {statement}", parameters
+                    )
+                ]
+                used = used_indexes.setdefault(endpoint.split("?")[0], set())
+                used.update(re.findall(r"INDEX (\w+)", " ".join(plan)))
+                scans = [
+                    step
+                    for step in plan
+                    if (match := FULL_SCAN.match(step))
+                    and match[1] in Base.metadata.tables
+                    and match[1] not in FULL_READS.get(endpoint.split("?")[0], ())
+                ]
+                if scans:
+                    failures.append(f"{endpoint}: {', '.join(scans)} in {statement}")
+                if args.verbose:
+                    print(f"{endpoint}: {' '.join(statement.split())}")
+                    for step in plan:
+                        print(f"    {step}")
+        engine.engine.dispose()
+
+    for endpoint, expected in EXPECTED_INDEXES.items():
+        missing = expected - used_indexes.get(endpoint, set())
+        if missing:
+            failures.append(f"{endpoint}: does not use {', '.join(sorted(missing))}")
+
+    print(f"{len(statements)} queries checked, {len(failures)} failures")
+    for failure in failures:
+        print(f"FAIL {' '.join(failure.split())}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Shared helpers for the benchmark scripts."""
+
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Base
+
+
+@contextmanager
+def temp_session():
+    """Yield a session bound to a fresh SQLite database in a temp directory."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        url = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+        engine = create_engine(url)
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        try:
+            yield db
+        finally:
+            db.close()
+            engine.dispose()
+
+
+def timed(func, *args, **kwargs) -> float:
+    """Run `func` and return the elapsed wall time in seconds."""
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
@@ -0,0 +1,115 @@
+"""
+Generators of synthetic Excel workbooks in the exact layout expected
+by the parsers, used to benchmark ingestion at plant scale.
+"""
+
+import random
+from datetime import datetime, timedelta
+from io import BytesIO
+
+from openpyxl import Workbook
+
+
+def _to_bytes(wb: Workbook) -> bytes:
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def grade_names(n_grades: int) -> list[str]:
+    """Synthetic steel grade names."""
+    return [f"G{i:04d}" for i in range(n_grades)]
+
+
+def daily_schedule_workbook(
+    days: int = 365,
+    heats_per_day: int = 24,
+    n_grades: int = 50,
+    start: datetime = datetime(2024, 1, 1),
+    seed: int = 0,
+) -> bytes:
+    """
+    Generate a `daily_charge_schedule.xlsx` workbook with one block of
+    ["Start time", "Grade", "Mould size"] columns per day.
+    """
+    rng = random.Random(seed)
+    grades = grade_names(n_grades)
+    minutes = 24 * 60 // heats_per_day
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Daily charge schedule")
+    ws.append(["Daily charge schedule"])
+    header = []
+    for day in range(days):
+        header += [start + timedelta(days=day), None, None]
+    ws.append(header)
+    ws.append(["Start time", "Grade", "Mould size"] * days)
+    for heat in range(heats_per_day):
+        time_start = datetime(1900, 1, 1) + timedelta(minutes=heat * minutes)
+        row = []
+        for _ in range(days):
+            row += [time_start, rng.choice(grades), '6 1/4"']
+        ws.append(row)
+    return _to_bytes(wb)
+
+
+def group_names(n_groups: int) -> list[str]:
+    """Synthetic product group names."""
+    return [f"Group{i:02d}" for i in range(n_groups)]
+
+
+def _month_starts(months: int, start: datetime) -> list[datetime]:
+    return [
+        datetime(
+            start.year + (start.month - 1 + m) // 12, (start.month - 1 + m) % 12 + 1, 24
+        )
+        for m in range(months)
+    ]
+
+
+def monthly_group_workbook(
+    months: int = 60,
+    n_groups: int = 10,
+    start: datetime = datetime(2020, 1, 1),
+    seed: int = 0,
+) -> bytes:
+    """
+    Generate a `product_groups_monthly.xlsx` workbook with one row of
+    planned heats per product group and one column per month.
+    """
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Monthly product group breakdown")
+    ws.append(["Order forecast (heats per quality group)"])
+    ws.append(["Quality:"] + _month_starts(months, start))
+    for group in group_names(n_groups):
+        ws.append([group] + [rng.randint(10, 250) for _ in range(months)])
+    return _to_bytes(wb)
+
+
+def steel_production_workbook(
+    months: int = 60,
+    n_groups: int = 10,
+    n_grades: int = 300,
+    start: datetime = datetime(2020, 1, 1),
+    seed: int = 0,
+) -> bytes:
+    """
+    Generate a `steel_grade_production.xlsx` workbook with one row of
+    produced tons per steel grade, grouped in blocks by product group
+    (the group name only appears on the first row of each block).
+    """
+    rng = random.Random(seed)
+    groups = group_names(n_groups)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Production history")
+    ws.append(["Production history (short tons)"])
+    ws.append(["Quality group", "Grade"] + _month_starts(months, start))
+    for i, grade in enumerate(grade_names(n_grades)):
+        group = groups[i * n_groups // n_grades]
+        first_in_block = i == 0 or groups[(i - 1) * n_groups // n_grades] != group
+        ws.append(
+            [group if first_in_block else None, grade]
+            + [rng.randint(0, 12000) for _ in range(months)]
+        )
+    return _to_bytes(wb)
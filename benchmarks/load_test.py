@@ -0,0 +1,118 @@
+"""
+Load test the read endpoints of a running server with concurrent clients,
+and report the p50/p99 latency and throughput of each endpoint. Uploads
+can be run in the background to measure reads under write load.
+
+Usage:
+    uvicorn main:app --port 8000
+    python -m benchmarks.load_test --clients 200 --duration 30 \
+        --upload old/steel_grade_production.xlsx new/steel_grade_production.xlsx
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+
+import httpx
+import numpy as np
+
+ENDPOINTS = [
+    "/forecast",
+    "/forecast/backtest",
+    "/steel_grades",
+    "/product_groups",
+    "/daily_schedules",
+    "/daily_schedules/rollup",
+    "/monthly_plans",
+    "/monthly_breakdown",
+]
+
+
+async def client(http: httpx.AsyncClient, deadline: float, bust: bool, results):
+    """Request random endpoints until the deadline, recording their latencies."""
+    while time.perf_counter() < deadline:
+        endpoint = random.choice(ENDPOINTS)
+        # a random parameter makes each request miss the response cache
+        params = {"_": random.random()} if bust else None
+        start = time.perf_counter()
+        try:
+            response = await http.get(endpoint, params=params)
+            ok = response.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        results.append((endpoint, time.perf_counter() - start, ok))
+
+
+async def uploader(
+    http: httpx.AsyncClient, deadline: float, paths: list[str], every: float
+):
+    """
+    Upload the given files in turn until the deadline. Re-uploading a file
+    identical to the previous one is skipped by the server, so pass at
+    least two versions of a file to keep writing.
+    """
+    files = []
+    for path in paths:
+        with open(path, "rb") as f:
+            files.append((os.path.basename(path), f.read()))
+    i = 0
+    while time.perf_counter() < deadline:
+        await http.post("/upload", files={"file": files[i % len(files)]})
+        i += 1
+        await asyncio.sleep(every)
+
+
+def report(results: list, seconds: float):
+    print(f"{'endpoint':<20}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for endpoint in [*ENDPOINTS, "all"]:
+        rows = [r for r in results if endpoint in ("all", r[0])]
+        if not rows:
+            continue
+        latencies = np.array([latency for _, latency, _ in rows]) * 1000
+        errors = sum(not ok for *_, ok in rows)
+        p50, p99 = np.percentile(latencies, [50, 99])
+        print(f"{endpoint:<20}{len(rows):>10}{errors:>8}{p50:>10.1f}{p99:>10.1f}")
+    print(f"throughput: {len(results) / seconds:.0f} requests/s")
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.clients + 1)
+    timeout = httpx.Timeout(60)
+    async with httpx.AsyncClient(
+        base_url=args.url, limits=limits, timeout=timeout
+    ) as http:
+        results = []
+        start = time.perf_counter()
+        deadline = start + args.duration
+        tasks = [
+            client(http, deadline, args.bust_cache, results)
+            for _ in range(args.clients)
+        ]
+        if args.upload:
+            tasks.append(uploader(http, deadline, args.upload, args.upload_every))
+        await asyncio.gather(*tasks)
+        report(results, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument(
+        "--bust-cache",
+        action="store_true",
+        help="add a random query parameter so that every request hits the database",
+    )
+    parser.add_argument(
+        "--upload", nargs="+", help="Excel files to upload in turn during the test"
+    )
+    parser.add_argument("--upload-every", type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
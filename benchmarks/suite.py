@@ -0,0 +1,249 @@
+"""
+Run the ingest and endpoint benchmarks through FastAPI's `TestClient`, on
+a fresh SQLite database filled with synthetic workbooks at plant scale,
+and write the results to a JSON file, so that they can be compared across
+commits. Each workbook is uploaded twice: the second version changes the
+data of the first, which exercises the update path. Endpoints are timed
+"cold", after invalidating the response and model caches as an upload
+does, and "warm", served from the response cache.
+
+Usage:
+    python -m benchmarks.suite --days 365 --grades 300 --output before.json
+    python -m benchmarks.suite --compare before.json after.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.generators import (
+    daily_schedule_workbook,
+    monthly_group_workbook,
+    steel_production_workbook,
+)
+
+ENDPOINTS = [
+    "/forecast",
+    "/forecast?model=ewma",
+    "/forecast?model=seasonal",
+    "/forecast?horizon=3",
+    "/forecast/backtest",
+    "/steel_grades",
+    "/product_groups",
+    "/daily_schedules",
+    "/daily_schedules/rollup",
+    "/monthly_plans",
+    "/monthly_breakdown",
+]
+
+
+def workbooks(args, seed: int) -> list[tuple[str, bytes]]:
+    """
+    The workbooks to upload, in the order that creates the groups and
+    grades first. The plans cover one more month than the production
+    history, to be forecast.
+    """
+    return [
+        (
+            "steel_grade_production.xlsx",
+            steel_production_workbook(args.months, args.groups, args.grades, seed=seed),
+        ),
+        (
+            "product_groups_monthly.xlsx",
+            monthly_group_workbook(args.months + 1, args.groups, seed=seed),
+        ),
+        (
+            "daily_charge_schedule.xlsx",
+            daily_schedule_workbook(
+                args.days, args.heats_per_day, args.grades, seed=seed
+            ),
+        ),
+    ]
+
+
+def _git_commit() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def _sql_statements(response) -> int | None:
+    """The SQL statements of a request, from its `Server-Timing` header."""
+    match = re.search(r'statements: (\d+)"', response.headers.get("server-timing", ""))
+    return int(match.group(1)) if match else None
+
+
+def _import_jobs():
+    import jobs  # noqa: F401
+
+
+def warm_up(job_manager):
+    """
+    Start the worker processes of the uploads and import the upload jobs
+    and the parsers in them, so that the first uploads are not timed with
+    their start-up.
+    """
+    _, processes = job_manager._executors()
+    futures = [processes.submit(_import_jobs) for _ in range(job_manager.workers)]
+    for future in futures:
+        future.result()
+
+
+def bench_ingest(client, files: list[tuple[str, bytes]], name: str) -> list[dict]:
+    """Upload the files one at a time, timing each until its job is done."""
+    results = []
+    for filename, contents in files:
+        start = time.perf_counter()
+        response = client.post("/upload", files={"file": (filename, contents)})
+        response.raise_for_status()
+        job = response.json()
+        while job["status"] in ("queued", "running"):
+            time.sleep(0.01)
+            job = client.get(f"/jobs/{job['id']}").json()
+        seconds = time.perf_counter() - start
+        if job["status"] != "succeeded":
+            raise RuntimeError(f"Upload of {filename} {job['status']}: {job['error']}")
+        results.append(
+            {
+                "name": f"{name} {filename}",
+                "seconds": seconds,
+                "size": job["size"],
+                "rows_parsed": job["rows_parsed"],
+                "rows_written": job["rows_written"],
+                "rows_per_second": job["rows_parsed"] / seconds,
+                "peak_rss": job["peak_rss"],
+                "stages": job["stages"],
+            }
+        )
+        print(
+            f"{name} {filename}: {seconds:.2f} s, {job['rows_parsed']} rows, "
+            f"{job['rows_parsed'] / seconds:,.0f} rows/s"
+        )
+    return results
+
+
+def bench_endpoint(client, path: str, repeat: int) -> dict:
+    """Time an endpoint with cold and warm caches, taking the median of `repeat`."""
+    from cache import response_cache
+
+    cold, warm = [], []
+    for _ in range(repeat):
+        response_cache.bump()
+        start = time.perf_counter()
+        response = client.get(path)
+        cold.append(time.perf_counter() - start)
+        response.raise_for_status()
+        start = time.perf_counter()
+        client.get(path)
+        warm.append(time.perf_counter() - start)
+    result = {
+        "name": path,
+        "cold_seconds": statistics.median(cold),
+        "warm_seconds": statistics.median(warm),
+        "sql_statements": _sql_statements(response),
+        "bytes": len(response.content),
+    }
+    print(
+        f"{path}: cold {result['cold_seconds'] * 1000:.1f} ms, "
+        f"warm {result['warm_seconds'] * 1000:.1f} ms, "
+        f"{result['sql_statements']} SQL statements"
+    )
+    return result
+
+
+def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # the app creates its engines on import, from the environment
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+        from fastapi.testclient import TestClient
+
+        import main
+
+        with TestClient(main.app) as client:
+            warm_up(main.job_manager)
+            ingest = bench_ingest(client, workbooks(args, seed=0), "insert")
+            ingest += bench_ingest(client, workbooks(args, seed=1), "update")
+            endpoints = [
+                bench_endpoint(client, path, args.repeat) for path in ENDPOINTS
+            ]
+    return {
+        "commit": _git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "days": args.days,
+            "heats_per_day": args.heats_per_day,
+            "grades": args.grades,
+            "groups": args.groups,
+            "months": args.months,
+            "repeat": args.repeat,
+        },
+        "ingest": ingest,
+        "endpoints": endpoints,
+    }
+
+
+def compare(old_path: str, new_path: str):
+    """Print the change in the timings of two result files."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    if old["params"] != new["params"]:
+        print(f"Warning: different parameters, {old['params']} != {new['params']}")
+    print(f"{old['commit']} -> {new['commit']}")
+    for section, metrics in [
+        ("ingest", ["seconds"]),
+        ("endpoints", ["cold_seconds", "warm_seconds"]),
+    ]:
+        old_results = {result["name"]: result for result in old[section]}
+        for result in new[section]:
+            if result["name"] not in old_results:
+                continue
+            for metric in metrics:
+                before = old_results[result["name"]][metric]
+                after = result[metric]
+                print(
+                    f"{result['name']} {metric}: {before * 1000:.1f} ms -> "
+                    f"{after * 1000:.1f} ms ({after / before:.2f}x)"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--heats-per-day", type=int, default=24)
+    parser.add_argument("--grades", type=int, default=300)
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--months", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    results = run(args)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+
+
+class CacheEntry(NamedTuple):
+    body: bytes
+    etag: str
+    headers: dict
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of serialized JSON responses, keyed by endpoint
+    and query parameters. The data only changes when an upload succeeds,
+    which bumps the generation counter and clears the cache.
+    """
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> CacheEntry | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(
+        self, key, body: bytes, generation: int, headers: dict | None = None
+    ) -> CacheEntry:
+        """
+        Store a response body computed at the given generation. It is not
+        cached if an upload bumped the generation in the meantime.
+        """
+        etag = f'"{generation}-{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        entry = CacheEntry(body, etag, headers or {})
+        with self._lock:
+            if generation == self.generation and self.maxsize > 0:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def bump(self):
+        """Invalidate all cached responses after the data has changed."""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+# responses being computed on a cache miss, by cache key, so that concurrent
+# requests for the same response wait for it instead of computing it again
+_loading: dict = {}
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _cache_key(request: Request):
+    return (request.url.path, tuple(sorted(request.query_params.multi_items())))
+
+
+def _store(key, content, generation: int) -> CacheEntry | None:
+    """
+    Cache the JSON content or `JSONResponse` returned by an endpoint.
+    Returns None for other responses, e.g. streams, which are not cached.
+    """
+    if isinstance(content, Response) and not isinstance(content, JSONResponse):
+        return None
+    if not isinstance(content, JSONResponse):
+        content = JSONResponse(jsonable_encoder(content))
+    headers = {
+        name: value
+        for name, value in content.headers.items()
+        if name not in ("content-length", "content-type")
+    }
+    return response_cache.put(key, content.body, generation, headers)
+
+
+def _respond(request: Request, entry: CacheEntry) -> Response:
+    headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+def cached(endpoint):
+    """
+    Decorator for async read endpoints that serves their JSON response (or
+    the body and headers of their `JSONResponse`) from the response cache,
+    with an `ETag` header. Requests whose `If-None-Match` header matches
+    the current `ETag` get an empty 304 response. Cache hits are served on
+    the event loop, so endpoints should only offload their work to the
+    threadpool on a miss, where the response is also serialized. Concurrent
+    requests that miss the same response wait for a single computation.
+    """
+    if not inspect.iscoroutinefunction(endpoint):
+        raise TypeError(f"{endpoint.__name__} must be async to be cached.")
+    signature = inspect.signature(endpoint)
+    request_param = inspect.Parameter(
+        "request", inspect.Parameter.KEYWORD_ONLY, annotation=Request
+    )
+
+    async def load(key, args, kwargs):
+        generation = response_cache.generation
+        content = await endpoint(*args, **kwargs)
+        # serializing a large response would block the event loop too
+        entry = await run_in_threadpool(_store, key, content, generation)
+        return content, entry
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, request: Request, **kwargs):
+        key = _cache_key(request)
+        entry = response_cache.get(key)
+        if entry is None:
+            loading = _loading.get(key)
+            first = loading is None
+            if first:
+                loading = asyncio.ensure_future(load(key, args, kwargs))
+                _loading[key] = loading
+                loading.add_done_callback(lambda _: _loading.pop(key, None))
+            content, entry = await asyncio.shield(loading)
+            if entry is None:
+                # not cacheable, e.g. a stream, which can only be sent once
+                return content if first else await endpoint(*args, **kwargs)
+        return _respond(request, entry)
+
+    wrapper.__signature__ = signature.replace(
+        parameters=[*signature.parameters.values(), request_param]
+    )
+    return wrapper
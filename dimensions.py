@@ -0,0 +1,107 @@
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from metrics import count_rows
+from models import Grade, Group
+
+
+class DimensionCache:
+    """
+    In-memory cache of the name <-> id mappings of the 'groups' and
+    'grades' tables, and of the group each grade belongs to. It is
+    loaded once from the database and then kept up to date by the
+    parsers, so that dimension lookups are dict hits instead of queries.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.group_ids = {}  # group name -> group id
+        self.group_names = {}  # group id -> group name
+        self.grade_ids = {}  # grade name -> grade id
+        self.grade_names = {}  # grade id -> grade name
+        self.grade_groups = {}  # grade id -> group id
+
+    def load(self, db: Session):
+        """Load all groups and grades from the database."""
+        groups = db.execute(select(Group.id, Group.name)).all()
+        grades = db.execute(select(Grade.id, Grade.name, Grade.group_id)).all()
+        count_rows(len(groups) + len(grades))
+        with self._lock:
+            self.group_ids = {name: id for id, name in groups}
+            self.group_names = {id: name for id, name in groups}
+            self.grade_ids = {name: id for id, name, _ in grades}
+            self.grade_names = {id: name for id, name, _ in grades}
+            self.grade_groups = {id: group_id for id, _, group_id in grades}
+            self.loaded = True
+
+    def ensure_loaded(self, db: Session):
+        """Load the cache if it is empty or has been invalidated."""
+        with self._lock:
+            if not self.loaded:
+                self.load(db)
+
+    def invalidate(self):
+        """Drop the cached mappings, they will be reloaded on next use."""
+        with self._lock:
+            self.loaded = False
+
+    def ids(self, model, names: list[str]) -> dict:
+        """Return the cached ids of the given `Group` or `Grade` names."""
+        cached = self.group_ids if model is Group else self.grade_ids
+        return {name: cached[name] for name in names if name in cached}
+
+    def add(self, model, ids: dict):
+        """Add name -> id mappings of `Group` or `Grade` entries."""
+        with self._lock:
+            if not self.loaded:
+                return
+            if model is Group:
+                self.group_ids.update(ids)
+                self.group_names.update({id: name for name, id in ids.items()})
+            else:
+                self.grade_ids.update(ids)
+                self.grade_names.update({id: name for name, id in ids.items()})
+
+    def set_grade_groups(self, grade_groups: dict):
+        """
+        Record the group of each grade (grade id -> group id). If this
+        changes the group of a grade that was already cached, the whole
+        cache is invalidated.
+        """
+        with self._lock:
+            if not self.loaded:
+                return
+            for grade_id, group_id in grade_groups.items():
+                if self.grade_groups.get(grade_id, group_id) != group_id:
+                    self.loaded = False
+                    return
+            self.grade_groups.update(grade_groups)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def database_key(engine: Engine) -> str:
+    """Identify the database of `engine`, whatever driver it connects with."""
+    url = engine.url
+    return url.set(drivername=url.get_backend_name()).render_as_string()
+
+
+def get_dimensions(db: Session) -> DimensionCache:
+    """
+    Get the loaded dimension cache shared by all sessions of the same
+    database as `db`, including the sync sessions of async sessions
+    (e.g. in `AsyncSession.run_sync`).
+    """
+    key = database_key(db.get_bind())
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = DimensionCache()
+        cache = _caches[key]
+    cache.ensure_loaded(db)
+    return cache
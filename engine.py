@@ -1,19 +1,123 @@
 import os
 
-from sqlalchemy import create_engine
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
 
-from models import Base
+from metrics import instrument_engine
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///steel_production_plan.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# configuration of the database migrations
+ALEMBIC_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+# async drivers used by the read endpoints, for each backend
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+# SQLite: milliseconds a connection waits for a lock before raising "database is locked"
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))
+# PostgreSQL: connection pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Tune each new SQLite connection: in WAL mode readers are not blocked
+    by a running upload, and `synchronous=NORMAL` is durable enough in
+    WAL mode while avoiding an fsync on every commit.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    cursor.close()
+
+
+def _engine_options(url: str) -> dict:
+    """Keyword arguments of the engine of the database at `url`, for its backend."""
+    backend = make_url(url).get_backend_name()
+    if backend == "sqlite":
+        return {
+            "connect_args": {
+                "check_same_thread": False,
+                "timeout": SQLITE_BUSY_TIMEOUT / 1000,
+            }
+        }
+    if backend == "postgresql":
+        return {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": DB_POOL_PRE_PING,
+        }
+    raise ValueError(
+        f"Database backend '{backend}' not supported, must be sqlite or postgresql."
+    )
+
+
+def _async_url(url: str) -> str:
+    """Use the async driver of the backend of the database at `url`."""
+    url = make_url(url)
+    drivername = ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+def create_db_engine(url: str = DATABASE_URL):
+    """Create the engine of the database at `url`, configured for its backend."""
+    engine = create_engine(url, **_engine_options(url))
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    instrument_engine(engine)
+    return engine
+
+
+def create_async_db_engine(url: str = DATABASE_URL):
+    """
+    Create an async engine of the database at `url`, through the async
+    driver of its backend (aiosqlite or asyncpg), configured like the
+    engine returned by `create_db_engine`.
+    """
+    url = _async_url(url)
+    engine = create_async_engine(url, **_engine_options(url))
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+    instrument_engine(engine.sync_engine)
+    return engine
+
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# the read endpoints use an async session, so that they don't take a
+# thread of the threadpool while waiting on the database
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
 
 def init_db():
-    """Create the database tables."""
-    Base.metadata.create_all(bind=engine)
+    """
+    Create the database tables, or upgrade them to the latest migration.
+    A database created before migrations were introduced runs all of them:
+    the baseline migration only creates the tables it is missing, and the
+    later ones add to the tables (and backfill them) as they do for any
+    other database.
+    """
+    config = Config(ALEMBIC_CONFIG)
+    # the connection is not in a transaction, each migration runs in its own
+    with engine.connect() as connection:
+        config.attributes["connection"] = connection
+        command.upgrade(config, "head")
     print("Database initialized.")
 
 
@@ -24,3 +128,23 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Get an async database session."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def _call_with_session(func, *args):
+    with SessionLocal() as db:
+        return func(db, *args)
+
+
+async def run_in_session(func, *args):
+    """
+    Run `func(db, *args)` with a new database session in the threadpool,
+    for CPU-bound work such as fitting models or building large responses,
+    which would block every other request if run on the event loop.
+    """
+    return await run_in_threadpool(_call_with_session, func, *args)
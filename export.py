@@ -0,0 +1,168 @@
+import csv
+import io
+import json
+from io import StringIO
+from typing import Callable, Literal
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+
+from dimensions import DimensionCache, get_dimensions
+from engine import AsyncSessionLocal
+from metrics import count_rows
+
+ExportFormat = Literal["json", "ndjson", "csv", "arrow", "parquet"]
+
+# number of rows fetched from the database cursor and written per chunk
+CHUNK_SIZE = 1000
+# number of rows per record batch of the columnar formats
+ARROW_CHUNK_SIZE = 65536
+
+MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXTENSIONS = {"csv": "csv", "arrow": "arrows", "parquet": "parquet"}
+
+
+async def _iter_rows(query: Select, chunk_size: int):
+    """
+    Yield the rows of `query` in chunks fetched from a server-side cursor,
+    with the dimension cache. The session is opened here rather than
+    injected, as it must stay open while the response is being streamed.
+    """
+    async with AsyncSessionLocal() as db:
+        dimensions: DimensionCache = await db.run_sync(get_dimensions)
+        result = await db.stream(query.execution_options(yield_per=chunk_size))
+        async for rows in result.partitions():
+            count_rows(len(rows))
+            yield rows, dimensions
+
+
+async def _iter_records(query: Select, to_record: Callable[..., dict]):
+    """Yield the records of `query` in chunks."""
+    async for rows, dimensions in _iter_rows(query, CHUNK_SIZE):
+        yield [to_record(row, dimensions) for row in rows]
+
+
+def _record_batch(rows, schema: pa.Schema, dimensions: DimensionCache):
+    """
+    Build a record batch with `schema` from a chunk of rows, one column at
+    a time. A field missing from the rows is looked up from the ids of its
+    dimension, e.g. "grade" from the "grade_id" column.
+    """
+    columns = dict(zip(rows[0]._fields, zip(*rows)))
+    arrays = []
+    for field in schema:
+        if field.name in columns:
+            values = columns[field.name]
+        else:
+            names = getattr(dimensions, f"{field.name}_names")
+            values = [names.get(key) for key in columns[f"{field.name}_id"]]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+async def _iter_batches(query: Select, schema: pa.Schema):
+    """Yield the rows of `query` as Arrow record batches."""
+    async for rows, dimensions in _iter_rows(query, ARROW_CHUNK_SIZE):
+        yield _record_batch(rows, schema, dimensions)
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    A file to write Arrow streams and Parquet files to, whose written bytes
+    are taken out as they are streamed. The position keeps counting, as
+    the Parquet footer holds the offsets of the row groups.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def _arrow_chunks(batches, schema: pa.Schema, format: ExportFormat):
+    """
+    Write the record batches to an Arrow IPC stream or to a Parquet file,
+    with a row group per batch, yielding the bytes written so far after
+    each batch.
+    """
+    sink = _ChunkSink()
+    if format == "arrow":
+        writer = pa.ipc.new_stream(sink, schema)
+    else:
+        writer = pq.ParquetWriter(sink, schema)
+    async for batch in batches:
+        writer.write_batch(batch)
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+async def _ndjson_lines(chunks):
+    async for records in chunks:
+        yield "".join(json.dumps(record, default=str) + "\n" for record in records)
+
+
+async def _csv_lines(chunks, fieldnames: list[str]):
+    buffer = StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+    writer.writeheader()
+    async for records in chunks:
+        writer.writerows(records)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_table(
+    query: Select,
+    to_record: Callable[..., dict],
+    schema: pa.Schema,
+    format: ExportFormat,
+    filename: str,
+) -> StreamingResponse:
+    """
+    Stream the rows of `query` as newline-delimited JSON or CSV, or as an
+    Arrow IPC stream or a Parquet file, so that memory use doesn't grow
+    with the size of the table. `to_record` maps each row and the dimension
+    cache to a flat record with the fields of `schema`, for the text
+    formats. The columnar formats are built from the rows with the types
+    of `schema`.
+    """
+    headers = {}
+    if format in EXTENSIONS:
+        attachment = f"{filename}.{EXTENSIONS[format]}"
+        headers["Content-Disposition"] = f'attachment; filename="{attachment}"'
+    if format in ("arrow", "parquet"):
+        chunks = _arrow_chunks(_iter_batches(query, schema), schema, format)
+        return StreamingResponse(
+            chunks, media_type=MEDIA_TYPES[format], headers=headers
+        )
+    chunks = _iter_records(query, to_record)
+    if format == "ndjson":
+        return StreamingResponse(
+            _ndjson_lines(chunks), media_type="application/x-ndjson"
+        )
+    return StreamingResponse(
+        _csv_lines(chunks, schema.names), media_type="text/csv", headers=headers
+    )
@@ -0,0 +1,285 @@
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import (
+    String,
+    and_,
+    case,
+    cast,
+    delete,
+    exists,
+    func,
+    insert,
+    select,
+)
+from sqlalchemy.orm import Session
+
+from dimensions import get_dimensions
+from metrics import count_rows
+from models import Grade, GradeRatio, Group, MonthlyBreakdown, MonthlyGroupPlan
+
+# tons per heat of the grades without their own `tons_per_heat`
+TONS_PER_HEAT = float(os.getenv("TONS_PER_HEAT", "100"))
+
+# tons per heat of each grade
+tons_per_heat = func.coalesce(Grade.tons_per_heat, TONS_PER_HEAT)
+
+
+def refresh_grade_ratios(db: Session, grade_ids=None, group_ids=None):
+    """
+    Recompute the rows of the 'grade_ratios' table for the given grades,
+    or for all grades of the given groups. If neither is given, the whole
+    table is rebuilt. The ratio of a grade in a given month is its
+    production in tons divided by the heats planned for its group in that
+    month, and only months with a positive group plan are counted. Does
+    not commit, so that it runs in the transaction of the caller.
+    """
+    grades = select(Grade.id)
+    if grade_ids is not None:
+        grades = grades.where(Grade.id.in_(list(grade_ids)))
+    if group_ids is not None:
+        grades = grades.where(Grade.group_id.in_(list(group_ids)))
+
+    ratio = case(
+        (
+            MonthlyGroupPlan.heats > 0,
+            MonthlyBreakdown.tons * 1.0 / MonthlyGroupPlan.heats,
+        )
+    )
+    ratios = (
+        select(
+            MonthlyBreakdown.grade_id,
+            func.coalesce(func.sum(ratio), 0.0),
+            func.count(ratio),
+        )
+        .join(Grade, Grade.id == MonthlyBreakdown.grade_id)
+        .outerjoin(
+            MonthlyGroupPlan,
+            and_(
+                MonthlyGroupPlan.group_id == Grade.group_id,
+                MonthlyGroupPlan.month == MonthlyBreakdown.month,
+            ),
+        )
+        .where(MonthlyBreakdown.grade_id.in_(grades))
+        .group_by(MonthlyBreakdown.grade_id)
+    )
+
+    db.execute(delete(GradeRatio).where(GradeRatio.grade_id.in_(grades)))
+    db.execute(
+        insert(GradeRatio).from_select(["grade_id", "ratio_sum", "ratio_count"], ratios)
+    )
+
+
+def ensure_grade_ratios(db: Session):
+    """
+    Build the 'grade_ratios' table if it is empty but there is production
+    history, e.g. on a database created before the table existed.
+    """
+    has_ratios = db.execute(select(exists().select_from(GradeRatio))).scalar()
+    has_history = db.execute(select(exists().select_from(MonthlyBreakdown))).scalar()
+    if has_history and not has_ratios:
+        refresh_grade_ratios(db)
+        db.commit()
+
+
+def forecast_plans(db: Session) -> list:
+    """
+    The month to forecast of each group, which is its last planned month
+    if it has no production breakdown yet, as (group id, group name,
+    month, planned heats) rows ordered by group id.
+    """
+    last_month = (
+        select(
+            MonthlyGroupPlan.group_id,
+            func.max(MonthlyGroupPlan.month).label("month"),
+        )
+        .group_by(MonthlyGroupPlan.group_id)
+        .subquery()
+    )
+    has_breakdown = exists().where(
+        MonthlyBreakdown.month == last_month.c.month,
+        MonthlyBreakdown.grade_id == Grade.id,
+        Grade.group_id == last_month.c.group_id,
+    )
+    plans = db.execute(
+        select(Group.id, Group.name, last_month.c.month, MonthlyGroupPlan.heats)
+        .join(last_month, last_month.c.group_id == Group.id)
+        .join(
+            MonthlyGroupPlan,
+            and_(
+                MonthlyGroupPlan.group_id == Group.id,
+                MonthlyGroupPlan.month == last_month.c.month,
+            ),
+        )
+        .where(~has_breakdown)
+        .order_by(Group.id)
+    ).all()
+    count_rows(len(plans))
+    return plans
+
+
+def plans_to_forecast(db: Session, months: list[date] | None = None) -> list:
+    """
+    The planned months of each group to forecast: the given `months`, or
+    else all its planned months without a production breakdown yet, as
+    (group id, group name, month, planned heats) rows ordered by group id
+    and month.
+    """
+    query = (
+        select(Group.id, Group.name, MonthlyGroupPlan.month, MonthlyGroupPlan.heats)
+        .join(MonthlyGroupPlan, MonthlyGroupPlan.group_id == Group.id)
+        .order_by(MonthlyGroupPlan.group_id, MonthlyGroupPlan.month)
+    )
+    if months is not None:
+        query = query.where(MonthlyGroupPlan.month.in_(months))
+    else:
+        # looked up by (month, grade) for the grades of the group, instead of
+        # scanning the breakdown of all grades in the month
+        has_breakdown = exists().where(
+            MonthlyBreakdown.month == MonthlyGroupPlan.month,
+            MonthlyBreakdown.grade_id.in_(
+                select(Grade.id).where(Grade.group_id == MonthlyGroupPlan.group_id)
+            ),
+        )
+        query = query.where(~has_breakdown)
+    plans = db.execute(query).all()
+    count_rows(len(plans))
+    return plans
+
+
+def load_grade_history(db: Session) -> pd.DataFrame:
+    """
+    Load the production history of the grades that belong to a group,
+    with the heats planned for their group in each month (null if there
+    is no plan), in one query ordered by grade and month, with columns
+    ["grade_id", "group_id", "month", "tons", "tons_per_heat", "heats"].
+    The month is read as an ISO string, which skips parsing a date per row.
+    """
+    history = pd.read_sql(
+        select(
+            MonthlyBreakdown.grade_id,
+            Grade.group_id,
+            cast(MonthlyBreakdown.month, String).label("month"),
+            MonthlyBreakdown.tons,
+            tons_per_heat.label("tons_per_heat"),
+            MonthlyGroupPlan.heats,
+        )
+        .join(Grade, Grade.id == MonthlyBreakdown.grade_id)
+        .outerjoin(
+            MonthlyGroupPlan,
+            and_(
+                MonthlyGroupPlan.group_id == Grade.group_id,
+                MonthlyGroupPlan.month == MonthlyBreakdown.month,
+            ),
+        )
+        .where(Grade.group_id.is_not(None))
+        .order_by(MonthlyBreakdown.grade_id, MonthlyBreakdown.month),
+        db.connection(),
+    )
+    count_rows(len(history))
+    return history
+
+
+def backtest_errors(history: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rolling-origin evaluation of the forecast over the production history,
+    as returned by `load_grade_history`. Each month with a plan for the
+    group is forecast from the months before it only: the mean ratio of
+    each grade up to the previous month is taken from the cumulative sum
+    of its ratios, so that all months are evaluated in one pass instead
+    of once per month. Returns one row per forecast grade and month, with
+    columns ["grade_id", "group_id", "month", "forecast", "actual",
+    "error"], in heats.
+    """
+
+    # only the months with a plan have a ratio, and can be forecast
+    history = history[history["heats"] > 0]
+    grade_ids = history["grade_id"].to_numpy()
+    actual = (history["tons"] / history["tons_per_heat"]).to_numpy()
+    ratio = actual / history["heats"].to_numpy()
+
+    # sum and count of the ratios of each grade in the months before each
+    # row, from the running totals over all rows since rows are sorted by
+    # grade and month
+    row = np.arange(len(history))
+    first = np.ones(len(history), dtype=bool)
+    first[1:] = grade_ids[1:] != grade_ids[:-1]
+    grade_start = np.maximum.accumulate(np.where(first, row, 0))
+    running = np.concatenate([[0.0], np.cumsum(ratio)])
+    prior_sum = running[row] - running[grade_start]
+    prior_count = row - grade_start
+
+    # a month can only be forecast with at least one earlier ratio
+    evaluated = prior_count > 0
+    forecast = np.rint(
+        prior_sum[evaluated]
+        / prior_count[evaluated]
+        * history["heats"].to_numpy()[evaluated]
+    )
+    errors = history.loc[evaluated, ["grade_id", "group_id", "month"]]
+    return errors.assign(
+        forecast=forecast,
+        actual=actual[evaluated],
+        error=forecast - actual[evaluated],
+    ).reset_index(drop=True)
+
+
+def _accuracy(errors: pd.DataFrame, by: list[str]) -> pd.DataFrame:
+    """Mean absolute error and mean absolute percentage error by `by`."""
+    return errors.groupby(by, sort=True).agg(
+        mae=("absolute", "mean"),
+        mape=("percentage", "mean"),
+        forecasts=("absolute", "size"),
+    )
+
+
+def _metrics(mae: float, mape: float, forecasts: int) -> dict:
+    return {
+        "mae": None if np.isnan(mae) else round(float(mae), 3),
+        "mape": None if np.isnan(mape) else round(float(mape), 3),
+        "forecasts": int(forecasts),
+    }
+
+
+def backtest_from_history(
+    history: pd.DataFrame, group_names: dict, grade_names: dict
+) -> dict:
+    """
+    Accuracy of the forecast over the production history, as returned by
+    `load_grade_history`, from the rolling-origin errors of
+    `backtest_errors`. The MAE (in heats) and MAPE (in %, over the months
+    with a production) are returned overall, per group, and per grade
+    within each group, named from the given id -> name mappings.
+    """
+
+    errors = backtest_errors(history)
+    errors["absolute"] = errors["error"].abs()
+    actual = errors["actual"].where(errors["actual"] > 0)
+    errors["percentage"] = errors["absolute"] / actual * 100
+    groups = _accuracy(errors, ["group_id"])
+    grades = _accuracy(errors, ["group_id", "grade_id"])
+
+    result = {
+        "units": "heats",
+        "months": int(errors["month"].nunique()),
+        **_metrics(errors["absolute"].mean(), errors["percentage"].mean(), len(errors)),
+        "groups": {},
+    }
+    by_group = {}
+    for group_id, mae, mape, forecasts in groups.itertuples():
+        by_group[group_id] = {**_metrics(mae, mape, forecasts), "grades": {}}
+        result["groups"][group_names[group_id]] = by_group[group_id]
+    for (group_id, grade_id), mae, mape, forecasts in grades.itertuples():
+        grade = grade_names[grade_id]
+        by_group[group_id]["grades"][grade] = _metrics(mae, mape, forecasts)
+    return result
+
+
+def backtest_forecast(db: Session) -> dict:
+    """Backtest the forecast over the production history in the database."""
+    dimensions = get_dimensions(db)
+    return backtest_from_history(
+        load_grade_history(db), dimensions.group_names, dimensions.grade_names
+    )
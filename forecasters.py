@@ -0,0 +1,313 @@
+import os
+import threading
+from datetime import date
+from itertools import groupby, islice
+from operator import itemgetter
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from cache import response_cache
+from dimensions import database_key, get_dimensions
+from forecast import (
+    forecast_plans,
+    load_grade_history,
+    plans_to_forecast,
+    tons_per_heat,
+)
+from metrics import count_rows
+from models import Grade, GradeRatio
+
+# weight of the last month in the exponentially weighted ratio
+FORECAST_EWMA_ALPHA = float(os.getenv("FORECAST_EWMA_ALPHA", "0.3"))
+# number of last months averaged by the trailing ratio
+FORECAST_TRAILING_MONTHS = int(os.getenv("FORECAST_TRAILING_MONTHS", "12"))
+
+
+class RatioHistory(NamedTuple):
+    """
+    The production history as a (month x grade) matrix of the ratios of
+    the heats produced of each grade to the heats planned for its group,
+    NaN in the months without a breakdown or a positive plan.
+    """
+
+    months: np.ndarray  # months of the rows, as datetime64[M]
+    grade_ids: np.ndarray  # grades of the columns, in increasing order
+    group_ids: np.ndarray  # group of each grade
+    ratios: np.ndarray
+
+
+class FittedModel(NamedTuple):
+    grade_ids: np.ndarray
+    group_ids: np.ndarray
+    params: np.ndarray  # the parameters of the model, one column per grade
+
+
+def load_ratio_history(db: Session) -> RatioHistory:
+    """Load the production history of the grades as a `RatioHistory`."""
+    history = load_grade_history(db)
+    months, month_rows = np.unique(history["month"].to_numpy(), return_inverse=True)
+    grade_ids, grade_columns = np.unique(
+        history["grade_id"].to_numpy(), return_inverse=True
+    )
+    group_ids = np.zeros(len(grade_ids), dtype=np.int64)
+    group_ids[grade_columns] = history["group_id"].to_numpy()
+
+    heats = history["heats"].where(history["heats"] > 0)
+    ratios = np.full((len(months), len(grade_ids)), np.nan)
+    ratios[month_rows, grade_columns] = (
+        history["tons"] / history["tons_per_heat"] / heats
+    ).to_numpy()
+    return RatioHistory(months.astype("datetime64[M]"), grade_ids, group_ids, ratios)
+
+
+def _mean(ratios: np.ndarray) -> np.ndarray:
+    """Mean of the known ratios of each column, NaN if none is known."""
+    known = ~np.isnan(ratios)
+    count = known.sum(axis=0)
+    total = np.where(known, ratios, 0.0).sum(axis=0)
+    with np.errstate(invalid="ignore"):
+        return np.where(count > 0, total / count, np.nan)
+
+
+class Forecaster:
+    """
+    Base class of the forecasting models. A model is fitted on the ratio
+    history of the grades, and predicts the ratio of each grade in the
+    month to forecast, which is applied to the heats planned for its group.
+    Subclasses implement `fit_history`, and `ratios` if the ratio of a
+    grade depends on the month to forecast.
+    """
+
+    def fit(self, db: Session) -> FittedModel:
+        """Fit the model on the production history in the database."""
+        history = load_ratio_history(db)
+        return FittedModel(
+            history.grade_ids, history.group_ids, self.fit_history(history)
+        )
+
+    def fit_history(self, history: RatioHistory) -> np.ndarray:
+        """Fit the parameters of the model for each grade of `history`."""
+        raise NotImplementedError
+
+    def ratios(self, fitted: FittedModel, months: np.ndarray) -> np.ndarray:
+        """The ratio of each grade of `fitted` in the given months."""
+        return fitted.params
+
+    def predict(
+        self, fitted: FittedModel, months: np.ndarray, heats: np.ndarray
+    ) -> np.ndarray:
+        """
+        Forecast the heats of each grade of `fitted` in the given months
+        (datetime64[M]), from the heats planned for their groups, NaN for
+        the grades without a ratio.
+        """
+        return np.rint(self.ratios(fitted, months) * heats)
+
+
+class MeanRatio(Forecaster):
+    """Mean of the ratios of each grade over all months."""
+
+    def fit(self, db: Session) -> FittedModel:
+        """
+        Read the mean ratios from the 'grade_ratios' table, which is kept
+        up to date by the uploads, instead of the whole history.
+        """
+        rows = db.execute(
+            select(
+                Grade.id,
+                Grade.group_id,
+                GradeRatio.ratio_sum,
+                GradeRatio.ratio_count,
+                tons_per_heat,
+            )
+            .join(GradeRatio, GradeRatio.grade_id == Grade.id)
+            .where(Grade.group_id.is_not(None))
+            .order_by(Grade.id)
+        ).all()
+        count_rows(len(rows))
+        grade_ids, group_ids, ratio_sum, ratio_count, grade_tons = (
+            np.array(rows, dtype=float).reshape(-1, 5).T
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            params = np.where(
+                ratio_count > 0, ratio_sum / ratio_count / grade_tons, np.nan
+            )
+        return FittedModel(
+            grade_ids.astype(np.int64), group_ids.astype(np.int64), params
+        )
+
+    def fit_history(self, history: RatioHistory) -> np.ndarray:
+        return _mean(history.ratios)
+
+
+class EwmaRatio(Forecaster):
+    """
+    Exponentially weighted mean of the ratios of each grade, the weight of
+    each month decreasing by a factor (1 - alpha) per more recent month
+    with a ratio of the grade.
+    """
+
+    def __init__(self, alpha: float = FORECAST_EWMA_ALPHA):
+        self.alpha = alpha
+
+    def fit_history(self, history: RatioHistory) -> np.ndarray:
+        if not len(history.months):
+            return np.full(len(history.grade_ids), np.nan)
+        ewma = pd.DataFrame(history.ratios).ewm(alpha=self.alpha, ignore_na=True)
+        return ewma.mean().to_numpy()[-1]
+
+
+class TrailingRatio(Forecaster):
+    """Mean of the ratios of each grade over the last `window` months."""
+
+    def __init__(self, window: int = FORECAST_TRAILING_MONTHS):
+        self.window = window
+
+    def fit_history(self, history: RatioHistory) -> np.ndarray:
+        if not len(history.months):
+            return np.full(len(history.grade_ids), np.nan)
+        recent = history.months > history.months[-1] - self.window
+        return _mean(history.ratios[recent])
+
+
+class SeasonalRatio(Forecaster):
+    """
+    Mean of the ratios of each grade in the same calendar month as the
+    month to forecast, or over all months if the grade has no ratio in
+    that calendar month.
+    """
+
+    def fit_history(self, history: RatioHistory) -> np.ndarray:
+        # one row per calendar month, and a last row with the mean of all months
+        calendar_months = history.months.astype(np.int64) % 12
+        params = np.full((13, len(history.grade_ids)), np.nan)
+        for calendar_month in range(12):
+            params[calendar_month] = _mean(
+                history.ratios[calendar_months == calendar_month]
+            )
+        params[12] = _mean(history.ratios)
+        return params
+
+    def ratios(self, fitted: FittedModel, months: np.ndarray) -> np.ndarray:
+        columns = np.arange(len(fitted.grade_ids))
+        seasonal = fitted.params[months.astype(np.int64) % 12, columns]
+        return np.where(np.isnan(seasonal), fitted.params[12], seasonal)
+
+
+FORECASTERS = {
+    "mean": MeanRatio(),
+    "ewma": EwmaRatio(),
+    "trailing": TrailingRatio(),
+    "seasonal": SeasonalRatio(),
+}
+
+_fitted = {}  # (database, model) -> (cache generation, fitted model)
+_fitted_lock = threading.Lock()
+
+
+def fitted_model(db: Session, model: str) -> FittedModel:
+    """
+    Get the model fitted on the database of `db`. The fitted parameters
+    are cached until the next upload bumps the generation of the response
+    cache.
+    """
+    key = (database_key(db.get_bind()), model)
+    generation = response_cache.generation
+    with _fitted_lock:
+        cached = _fitted.get(key)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+    fitted = FORECASTERS[model].fit(db)
+    with _fitted_lock:
+        _fitted[key] = (generation, fitted)
+    return fitted
+
+
+def _predict_plans(db: Session, model: str, plans: list) -> list[dict]:
+    """
+    Forecast the heats of the grades of each group in the planned months
+    given as (group id, group name, month, planned heats) rows, with the
+    fitted `model`. All months are predicted in one operation over the
+    (grade, planned month) pairs. Returns the forecast of each plan.
+    """
+    fitted = fitted_model(db, model)
+    dimensions = get_dimensions(db)
+    plan_groups = np.array([group_id for group_id, *_ in plans], dtype=np.int64)
+    plan_months = np.array([month for _, _, month, _ in plans], dtype="datetime64[M]")
+    plan_heats = np.array([heats for *_, heats in plans], dtype=float)
+
+    # the columns of the grades of each plan's group, in order of grade id
+    order = np.argsort(fitted.group_ids, kind="stable")
+    groups = fitted.group_ids[order]
+    starts = np.searchsorted(groups, plan_groups, side="left")
+    counts = np.searchsorted(groups, plan_groups, side="right") - starts
+    pairs = np.repeat(np.arange(len(plans)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    columns = order[np.repeat(starts, counts) + offsets]
+
+    pair_model = FittedModel(
+        fitted.grade_ids[columns],
+        fitted.group_ids[columns],
+        fitted.params[..., columns],
+    )
+    predictions = FORECASTERS[model].predict(
+        pair_model, plan_months[pairs], plan_heats[pairs]
+    )
+
+    forecasts = [{} for _ in plans]
+    for plan, grade_id, forecast in zip(pairs, pair_model.grade_ids, predictions):
+        grade = dimensions.grade_names[grade_id]
+        forecasts[plan][grade] = None if np.isnan(forecast) else int(forecast)
+    return forecasts
+
+
+def forecast_with(
+    db: Session,
+    model: str = "mean",
+    months: list[date] | None = None,
+    horizon: int | None = None,
+) -> dict:
+    """
+    Forecast the production of heats at grade level with the given model
+    of `FORECASTERS`. By default the last planned month of each group is
+    forecast, if it has no production breakdown yet, and each group gets a
+    single forecast with its month and units, as the original `/forecast`
+    returned. Otherwise, each group gets a list of forecasts, for the given
+    planned `months`, or for its first `horizon` planned months without a
+    production breakdown.
+    """
+    if months is None and horizon is None:
+        plans = forecast_plans(db)
+        forecasts = _predict_plans(db, model, plans)
+        return {
+            group_name: {
+                "forecast_month": month.strftime("%Y-%m"),
+                "units": "heats",
+                "forecast": forecast,
+            }
+            for (_, group_name, month, _), forecast in zip(plans, forecasts)
+        }
+
+    plans = plans_to_forecast(db, months)
+    if horizon is not None:
+        plans = [
+            plan
+            for _, group_plans in groupby(plans, key=itemgetter(0))
+            for plan in islice(group_plans, horizon)
+        ]
+    result = {}
+    for (_, group_name, month, _), forecast in zip(
+        plans, _predict_plans(db, model, plans)
+    ):
+        result.setdefault(group_name, []).append(
+            {
+                "forecast_month": month.strftime("%Y-%m"),
+                "units": "heats",
+                "forecast": forecast,
+            }
+        )
+    return result
@@ -0,0 +1,451 @@
+import hashlib
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import BinaryIO, NamedTuple
+
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from cache import response_cache
+from dimensions import get_dimensions
+from engine import SessionLocal
+from metrics import collect, observe_ingest
+from models import Upload
+from parsers import PARSERS, DailyScheduleParser
+
+# number of uploads parsed and written concurrently
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "2"))
+# maximum number of queued or running uploads, further uploads are rejected
+MAX_UPLOAD_JOBS = int(os.getenv("MAX_UPLOAD_JOBS", "8"))
+# maximum size in bytes of an uploaded file, larger files are rejected
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+# directory of the temporary files holding the uploads until they are parsed
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+# size of the chunks in which uploads are copied to their temporary file
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# number of finished jobs whose status is kept
+MAX_FINISHED_JOBS = 1000
+# statuses of the jobs that are done
+DONE_STATUSES = ("succeeded", "failed", "unchanged")
+
+
+class TooManyJobsError(Exception):
+    """Raised when the maximum number of pending upload jobs is reached."""
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an uploaded file is larger than `UPLOAD_MAX_BYTES`."""
+
+
+class BatchError(Exception):
+    """Raised when some files of a batch upload fail, with the batch report."""
+
+    def __init__(self, report: list[dict]):
+        super().__init__("Failed to upload batch.")
+        self.report = report
+
+
+class Job:
+    """Status and progress of an upload job."""
+
+    def __init__(self, filename: str):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.status = "queued"
+        self.rows_parsed = None
+        self.rows_written = None
+        self.error = None
+        self.content_hash = None
+        self.size = None
+        self.peak_rss = None
+        self.stages = {}
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in DONE_STATUSES
+
+    def to_dict(self) -> dict:
+        if self.started_at is None:
+            duration = None
+        else:
+            duration = (self.finished_at or time.time()) - self.started_at
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "rows_parsed": self.rows_parsed,
+            "rows_written": self.rows_written,
+            "size": self.size,
+            "peak_rss": self.peak_rss,
+            "stages": self.stages,
+            "duration": duration,
+            "error": self.error,
+        }
+
+
+class SpooledUpload(NamedTuple):
+    """An uploaded file copied to a temporary file."""
+
+    path: str
+    size: int
+    content_hash: str
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def spool_upload(source: BinaryIO, max_bytes: int = UPLOAD_MAX_BYTES) -> SpooledUpload:
+    """
+    Copy an uploaded file to a temporary file in chunks, hashing it on the
+    way, so that the worker processes read it from disk instead of being
+    sent its contents. Raises `UploadTooLargeError` as soon as more than
+    `max_bytes` are read.
+    """
+    content_hash = hashlib.sha256()
+    size = 0
+    f = tempfile.NamedTemporaryFile(suffix=".xlsx", dir=UPLOAD_TMP_DIR, delete=False)
+    try:
+        with f:
+            while chunk := source.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > max_bytes:
+                    msg = f"File larger than the maximum of {max_bytes} bytes."
+                    raise UploadTooLargeError(msg)
+                content_hash.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.unlink(f.name)
+        raise
+    return SpooledUpload(f.name, size, content_hash.hexdigest())
+
+
+def _reset_peak_rss():
+    """Reset the peak RSS of this process, where supported (Linux)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss() -> int:
+    """
+    Peak RSS of this process in bytes, since the last `_reset_peak_rss` on
+    Linux, or since the process started on other systems.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def read_spooled_excel(parser_cls, path: str) -> tuple[pd.DataFrame, float, int, dict]:
+    """
+    Read and pre-process the Excel file spooled to `path` with the given
+    parser class, and measure its time, the time of its stages and the
+    peak RSS of the process. This runs in a worker process, as parsing
+    Excel files is CPU-bound; the workers run one file at a time, so the
+    peak RSS is that of parsing the file.
+    """
+    _reset_peak_rss()
+    start = time.perf_counter()
+    parser = parser_cls(path, None)
+    with collect() as stats:
+        parser._read_excel()
+    return parser.df, time.perf_counter() - start, _peak_rss(), stats.stages
+
+
+def make_parser(parser_cls, path: str, db: Session, replace: bool = False):
+    """
+    Create a parser of the file at `path`. With `replace`, the daily
+    schedule parser replaces the schedule of the days of the file; the
+    other parsers always upsert.
+    """
+    if replace and parser_cls is DailyScheduleParser:
+        return parser_cls(path, db, replace=True)
+    return parser_cls(path, db)
+
+
+def is_unchanged(db: Session, parser_cls, content_hash: str) -> bool:
+    """Whether the last file ingested by the given parser had the same contents."""
+    last_hash = db.execute(
+        select(Upload.content_hash)
+        .where(Upload.parser == parser_cls.__name__)
+        .order_by(Upload.id.desc())
+        .limit(1)
+    ).scalar()
+    return last_hash == content_hash
+
+
+class JobManager:
+    """
+    Runs upload jobs in the background: the Excel files are parsed in a
+    pool of worker processes, so that they don't hold the GIL of the API
+    process, and written to the database one job at a time.
+    """
+
+    def __init__(self, workers: int = UPLOAD_WORKERS, max_jobs: int = MAX_UPLOAD_JOBS):
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._threads = None
+        self._processes = None
+
+    def _executors(self):
+        # created on first use, under the lock so that concurrent uploads
+        # don't each start a pool of worker processes
+        with self._lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(self.workers)
+                self._processes = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._threads, self._processes
+
+    def submit(
+        self,
+        parser_cls,
+        upload: SpooledUpload,
+        filename: str,
+        replace: bool = False,
+    ) -> Job:
+        """
+        Queue an upload job, or raise `TooManyJobsError` if busy. If the
+        file is identical to the last one ingested by the same parser, it
+        is skipped and the job is immediately done as "unchanged", unless
+        it `replace`s the stored schedule, which may hold heats of earlier
+        uploads. The job removes the temporary file of the upload once done.
+        """
+        job = Job(filename)
+        job.content_hash = upload.content_hash
+        job.size = upload.size
+        try:
+            self._queue(job, parser_cls, replace)
+        except BaseException:
+            upload.remove()
+            raise
+        if job.done:
+            upload.remove()
+            observe_ingest(parser_cls.__name__, job.status, job.stages)
+        else:
+            threads, _ = self._executors()
+            threads.submit(self._run, job, parser_cls, upload, replace)
+        return job
+
+    def _queue(self, job: Job, parser_cls, replace: bool):
+        """Add a job to the list of jobs, done already if its file is unchanged."""
+        with SessionLocal() as db:
+            if not replace and is_unchanged(db, parser_cls, job.content_hash):
+                job.status = "unchanged"
+                job.rows_written = 0
+                job.started_at = job.finished_at = time.time()
+        with self._lock:
+            pending = sum(not other.done for other in self.jobs.values())
+            if pending >= self.max_jobs and not job.done:
+                msg = f"Too many uploads in progress ({pending}), try again later."
+                raise TooManyJobsError(msg)
+            self.jobs[job.id] = job
+            finished = [other.id for other in self.jobs.values() if other.done]
+            for job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    def _run(self, job: Job, parser_cls, upload: SpooledUpload, replace: bool):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            _, processes = self._executors()
+            future = processes.submit(read_spooled_excel, parser_cls, upload.path)
+            df, _, job.peak_rss, job.stages = future.result()
+            # SQLite allows a single writer, so writes are serialized
+            with self._write_lock, SessionLocal() as db:
+                parser = make_parser(parser_cls, upload.path, db, replace)
+                parser.df = df
+                job.rows_parsed = parser.rows_parsed
+                # the rows and their ledger entry are written in one transaction
+                try:
+                    with collect() as stats:
+                        parser._add_to_db(commit=False)
+                    db.add(
+                        Upload(
+                            parser=parser_cls.__name__,
+                            filename=job.filename,
+                            content_hash=job.content_hash,
+                            rows_written=parser.rows_written,
+                        )
+                    )
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    # the cache may hold ids of grades or groups that were rolled back
+                    get_dimensions(db).invalidate()
+                    raise
+                job.stages.update(stats.stages)
+                parser._update_dimensions()
+            job.rows_written = parser.rows_written
+            # the upload has been committed, cached responses are now stale
+            response_cache.bump()
+            job.status = "succeeded"
+        except Exception as e:
+            job.error = f"Failed to parse {job.filename}: {e}"
+            job.status = "failed"
+        finally:
+            upload.remove()
+            job.finished_at = time.time()
+            observe_ingest(
+                parser_cls.__name__,
+                job.status,
+                job.stages,
+                job.rows_parsed,
+                job.rows_written,
+            )
+
+    def run_batch(
+        self, files: list[tuple[str, type, SpooledUpload]], replace: bool = False
+    ) -> list[dict]:
+        """
+        Upload a batch of (filename, parser class, spooled upload) files,
+        and remove their temporary files. All files are parsed concurrently
+        in the worker processes, then written in a single transaction, in
+        the order of `PARSERS` so that groups and grades are written before
+        the schedules. Files identical to the last one ingested by the same
+        parser are skipped, except daily schedules that `replace` the stored
+        schedule. Returns a report with the status, row counts and timings
+        of each file, or raises `BatchError` with the report if any file
+        fails, in which case nothing is written.
+        """
+        reports = []
+        try:
+            reports = self._run_batch(files, replace)
+        except BatchError as e:
+            reports = e.report
+            raise
+        finally:
+            for _, _, upload in files:
+                upload.remove()
+            for report in reports:
+                observe_ingest(
+                    report["parser"],
+                    report["status"],
+                    report["stages"],
+                    report["rows_parsed"],
+                    report["rows_written"],
+                )
+        return reports
+
+    def _run_batch(
+        self, files: list[tuple[str, type, SpooledUpload]], replace: bool
+    ) -> list[dict]:
+        _, processes = self._executors()
+        order = list(PARSERS.values())
+        files = sorted(files, key=lambda file: order.index(file[1]))
+        reports, pending = [], []
+        with SessionLocal() as db:
+            for filename, parser_cls, upload in files:
+                report = {
+                    "filename": filename,
+                    "parser": parser_cls.__name__,
+                    "status": "unchanged",
+                    "rows_parsed": None,
+                    "rows_written": 0,
+                    "size": upload.size,
+                    "peak_rss": None,
+                    "parse_seconds": None,
+                    "write_seconds": None,
+                    "stages": {},
+                    "error": None,
+                }
+                reports.append(report)
+                replaces = replace and parser_cls is DailyScheduleParser
+                if replaces or not is_unchanged(db, parser_cls, upload.content_hash):
+                    future = processes.submit(
+                        read_spooled_excel, parser_cls, upload.path
+                    )
+                    pending.append((report, parser_cls, upload, future))
+
+        parsed = []
+        for report, parser_cls, upload, future in pending:
+            try:
+                df, report["parse_seconds"], report["peak_rss"], report["stages"] = (
+                    future.result()
+                )
+                parsed.append((report, parser_cls, upload, df))
+            except Exception as e:
+                report["status"] = "failed"
+                report["error"] = f"Failed to parse {report['filename']}: {e}"
+        if len(parsed) < len(pending):
+            raise BatchError(reports)
+
+        with self._write_lock, SessionLocal() as db:
+            parsers = []
+            try:
+                for report, parser_cls, upload, df in parsed:
+                    start = time.perf_counter()
+                    parser = make_parser(parser_cls, upload.path, db, replace)
+                    parser.df = df
+                    with collect() as stats:
+                        parser._add_to_db(commit=False)
+                    report["stages"].update(stats.stages)
+                    db.add(
+                        Upload(
+                            parser=parser_cls.__name__,
+                            filename=report["filename"],
+                            content_hash=upload.content_hash,
+                            rows_written=parser.rows_written,
+                        )
+                    )
+                    report["rows_parsed"] = parser.rows_parsed
+                    report["rows_written"] = parser.rows_written
+                    report["write_seconds"] = time.perf_counter() - start
+                    parsers.append(parser)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                get_dimensions(db).invalidate()
+                report["status"] = "failed"
+                report["error"] = f"Failed to write {report['filename']}: {e}"
+                raise BatchError(reports)
+            for parser in parsers:
+                parser._update_dimensions()
+        for report, *_ in parsed:
+            report["status"] = "succeeded"
+        if parsed:
+            response_cache.bump()
+        return reports
+
+    def shutdown(self):
+        """Wait for the running jobs and stop the worker pools."""
+        with self._lock:
+            threads, processes = self._threads, self._processes
+            self._threads = self._processes = None
+        if threads is not None:
+            threads.shutdown()
+            processes.shutdown()
+
+
+job_manager = JobManager()
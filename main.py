@@ -1,13 +1,41 @@
 import math
+import os
+import zipfile
+from datetime import date, time
+from time import perf_counter
 
+from sqlalchemy import and_, or_, select
 from sqlalchemy.orm import Session
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 import pandas as pd
-
-from engine import get_db, init_db
-from models import Grade, MonthlyBreakdown, Group, DailySchedule, MonthlyGroupPlan
-from parsers import DailyScheduleParser, MonthlyGroupParser, SteelProductionParser
-
+import pyarrow as pa
+
+from cache import cached, response_cache
+from dimensions import DimensionCache, get_dimensions
+from engine import (
+    SessionLocal,
+    async_engine,
+    get_async_db,
+    get_db,
+    init_db,
+    run_in_session,
+)
+from export import ExportFormat, stream_table
+from forecast import TONS_PER_HEAT, backtest_forecast, ensure_grade_ratios
+from forecasters import FORECASTERS, forecast_with
+from jobs import (
+    UPLOAD_MAX_BYTES,
+    BatchError,
+    TooManyJobsError,
+    UploadTooLargeError,
+    job_manager,
+    spool_upload,
+)
+from metrics import collect, count_rows, observe_request, observe_rows, registry
+from models import Grade, MonthlyBreakdown, DailySchedule, MonthlyGroupPlan
+from parsers import PARSERS, DailyScheduleParser
+from rollups import schedule_rollup
 
 app = FastAPI(
     title="Steel Production Plan API",
@@ -18,23 +46,87 @@ app = FastAPI(
 )
 
 
-@app.post("/upload")
-def upload_file(
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-):
+# room for the multipart headers around the file of an upload
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
     """
-    Process and upload to the database an Excel file (`.xlsx`) containing steel production data.
-    The filename must contain 'daily_charge_schedule', 'product_groups_monthly', or
-    'steel_grade_production'.
+    Reject an upload with a 413 error before its body is received if its
+    declared length is larger than the maximum file size. Files sent
+    without a length, and the files of a batch, are checked as they are
+    copied to disk.
+    """
+    length = request.headers.get("content-length")
+    if (
+        request.method == "POST"
+        and request.url.path == "/upload"
+        and length is not None
+        and length.isdigit()
+        and int(length) > UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD
+    ):
+        msg = f"File larger than the maximum of {UPLOAD_MAX_BYTES} bytes."
+        return JSONResponse({"detail": msg}, status_code=413)
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def measure_request(request: Request, call_next):
     """
+    Time each request and count its SQL statements and the rows it processes,
+    for `/metrics`, and send them in a `Server-Timing` header. Streamed
+    responses are timed until their headers are sent, and their rows are
+    counted once their body is sent.
+    """
+    with collect() as stats:
+        response = await call_next(request)
+    route = request.scope.get("route")
+    route = route.path if route is not None else "unmatched"
+    observe_request(request.method, route, response.status_code, stats)
+    response.headers["Server-Timing"] = stats.server_timing()
+    body = response.body_iterator
+
+    async def count_rows_after_body():
+        async for chunk in body:
+            yield chunk
+        observe_rows(request.method, route, stats)
+
+    response.body_iterator = count_rows_after_body()
+    return response
 
-    filename = file.filename.lower()
-    accepted_filenames = [
-        "daily_charge_schedule",
-        "product_groups_monthly",
-        "steel_grade_production",
-    ]
+
+def _spool(filename: str, source):
+    """Copy an uploaded file to disk, or raise a 413 error if too large."""
+    try:
+        return spool_upload(source)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=f"{filename}: {e}")
+
+
+def _spool_archive(filename: str, source, batch: list):
+    """
+    Copy the Excel files of an uploaded `.zip` archive to disk one at a
+    time, adding them to `batch` as (filename, parser class, upload).
+    """
+    try:
+        archive = zipfile.ZipFile(source)
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=400, detail=f"{filename}: {e}")
+    with archive:
+        for name in archive.namelist():
+            basename = os.path.basename(name).lower()
+            if name.startswith("__MACOSX/") or not basename.endswith(".xlsx"):
+                continue
+            parser_cls = _get_parser_cls(basename)
+            with archive.open(name) as member:
+                batch.append((basename, parser_cls, _spool(name, member)))
+
+
+def _get_parser_cls(filename: str):
+    """Get the parser of an uploaded file, or raise a 400 error if not supported."""
+
+    accepted_filenames = sorted(PARSERS)
 
     if not filename.endswith(".xlsx"):
         msg = "Only .xlsx files are supported."
@@ -46,120 +138,167 @@ def upload_file(
         )
         raise HTTPException(status_code=400, detail=msg)
 
-    contents = file.file.read()
+    return next(PARSERS[name] for name in accepted_filenames if name in filename)
+
+
+@app.post("/upload", status_code=202)
+def upload_file(file: UploadFile = File(...), replace: bool = False):
+    """
+    Process and upload to the database an Excel file (`.xlsx`) containing steel production data.
+    The filename must contain 'daily_charge_schedule', 'product_groups_monthly', or
+    'steel_grade_production'. The file is processed in the background: the response
+    holds the id of the upload job, whose progress can be followed at `/jobs/{id}`.
+    Files larger than `UPLOAD_MAX_BYTES` are rejected with a 413 error. With
+    `replace`, a daily charge schedule replaces the schedule of the days it
+    covers: the stored heats of those days that are not in the file are deleted.
+    """
+
+    filename = file.filename.lower()
+    parser_cls = _get_parser_cls(filename)
+    if replace and parser_cls is not DailyScheduleParser:
+        msg = "Only daily_charge_schedule files can replace the stored data."
+        raise HTTPException(status_code=400, detail=msg)
+    upload = _spool(filename, file.file)
 
     try:
-        if "daily_charge_schedule" in filename:
-            daily_schedule_parser = DailyScheduleParser(contents, db)
-            daily_schedule_parser()
-        elif "product_groups_monthly" in filename:
-            monthly_group_parser = MonthlyGroupParser(contents, db)
-            monthly_group_parser()
-        elif "steel_grade_production" in filename:
-            steel_production_parser = SteelProductionParser(contents, db)
-            steel_production_parser()
-    except Exception as e:
-        msg = f"Failed to parse {filename}: {e}"
-        raise HTTPException(status_code=500, detail=msg)
+        job = job_manager.submit(parser_cls, upload, filename, replace)
+    except TooManyJobsError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return job.to_dict()
 
 
-@app.get("/forecast")
-def forecast_production(db=Depends(get_db)):
+@app.post("/upload/batch")
+def upload_batch(files: list[UploadFile] = File(...), replace: bool = False):
     """
-    Forecast the production of heats at grade level for the
-    next month based on historical data. The mean contribution
-    of each grade to its corresponding group is applied to the
-    planned group production for the forecasted month.
+    Process and upload to the database several Excel files (`.xlsx`) at once, sent as
+    separate files and/or as `.zip` archives of Excel files. The files are parsed in
+    parallel and written in a single transaction, groups and grades first. Returns a
+    report with the status and timings of each file. If any file fails, nothing is
+    written and the report is returned with a 422 status. Files, and files within
+    archives, larger than `UPLOAD_MAX_BYTES` are rejected with a 413 error. With
+    `replace`, the daily charge schedules replace the schedule of the days they cover.
     """
 
+    start = perf_counter()
+    batch = []
     try:
-        groups = db.query(Group).all()
-        forecasts = {}
-        for group in groups:
-            grades = db.query(Grade).filter_by(group=group)
-            # filter the grades that have production history
-            grades = grades.filter(Grade.tons != None).all()
-            # get all breakdowns for these grades
-            grade_ids = [grade.id for grade in grades]
-            breakdowns = (
-                db.query(MonthlyBreakdown)
-                .filter(MonthlyBreakdown.grade_id.in_(grade_ids))
-                .order_by(MonthlyBreakdown.month)
-                .all()
-            )
-            # get the production plan for this group
-            plans = (
-                db.query(MonthlyGroupPlan)
-                .filter_by(group_id=group.id)
-                .order_by(MonthlyGroupPlan.month)
-                .all()
-            )
+        for file in files:
+            filename = file.filename.lower()
+            if filename.endswith(".zip"):
+                _spool_archive(filename, file.file, batch)
+            else:
+                parser_cls = _get_parser_cls(filename)
+                batch.append((filename, parser_cls, _spool(filename, file.file)))
+    except HTTPException:
+        for _, _, upload in batch:
+            upload.remove()
+        raise
 
-            group_heats_by_month = {plan.month: plan.heats for plan in plans}
-
-            # assumption: 1 heat equals 100 tons
-            grade_heats_by_month = {}
-            for b in breakdowns:
-                if b.month not in grade_heats_by_month:
-                    grade_heats_by_month[b.month] = {}
-                grade_heats_by_month[b.month][b.grade_id] = b.tons / 100
-
-            # for each steel grade, calculate its historical production
-            # ratio relative to its group
-            mean_ratios = {}  # keys will be different steel grade ids
-            for grade in grades:
-                ratios = []
-                for month, heats_by_grade in grade_heats_by_month.items():
-                    if grade.id in heats_by_grade and month in group_heats_by_month:
-                        heats = group_heats_by_month[month]
-                        if heats and heats > 0:
-                            ratio = heats_by_grade[grade.id] / heats
-                            ratios.append(ratio)
-                mean_ratios[grade.id] = sum(ratios) / len(ratios) if ratios else None
-
-            # the forecast month should be the last month in the group production
-            # plans, and should not be contained in the grade breakdowns
-            forecast_month = list(group_heats_by_month.keys())
-            forecast_month = forecast_month[-1]
-            if forecast_month in grade_heats_by_month.keys():
-                print("Warning: no month to forecast.")
-                continue
+    try:
+        report = job_manager.run_batch(batch, replace)
+    except BatchError as e:
+        return JSONResponse({"files": e.report}, status_code=422)
+    count_rows(sum(file["rows_parsed"] or 0 for file in report))
+    return {"files": report, "duration": perf_counter() - start}
 
-            # apply the ratios calculated above to the group production plan
-            # for the forecast month
-            forecast_heats = group_heats_by_month[forecast_month]
-            forecast = {}
-            for grade in grades:
-                ratio = mean_ratios[grade.id]
-                if ratio is not None:
-                    forecast[grade.name] = int(round(ratio * forecast_heats))
-                else:
-                    forecast[grade.name] = None
-            forecasts[group.name] = {
-                "forecast_month": forecast_month.strftime("%Y-%m"),
-                "units": "heats",
-                "forecast": forecast,
-            }
 
-        return forecasts
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Metrics of the requests, the SQL statements and the uploads, in the
+    Prometheus text format.
+    """
+
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get the status and progress of an upload job."""
+
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return job.to_dict()
+
+
+# endpoints that fit models or build large responses check the response cache
+# on the event loop, and only run their CPU-bound work on a cache miss, in the
+# threadpool with a sync session: on the event loop (even through `run_sync`)
+# it would block every other request
+@app.get("/forecast")
+@cached
+async def forecast_production(
+    model: str = "mean",
+    months: str | None = None,
+    horizon: int | None = Query(None, ge=1),
+):
+    """
+    Forecast the production of heats at grade level for the
+    next month based on historical data. The contribution
+    of each grade to its corresponding group, estimated by the
+    given `model`, is applied to the planned group production
+    for the forecasted month. Models:
+    - mean: mean contribution over all months (default)
+    - ewma: exponentially weighted mean, recent months weigh more
+    - trailing: mean contribution over the last months
+    - seasonal: mean contribution in the same calendar month
+
+    To forecast several months, give either the planned `months` as a
+    comma-separated list of `YYYY-MM`, or a `horizon` to forecast the
+    next planned months without production data, up to that number of
+    months. Each group then gets a list of monthly forecasts.
+    """
 
+    if model not in FORECASTERS:
+        msg = f"Model must be one of the following: {', '.join(FORECASTERS)}."
+        raise HTTPException(status_code=400, detail=msg)
+    if months is not None and horizon is not None:
+        msg = "Give either the months or the horizon to forecast, not both."
+        raise HTTPException(status_code=400, detail=msg)
+    if months is not None:
+        months = [_parse_month(month.strip(), "months") for month in months.split(",")]
+    try:
+        return await run_in_session(forecast_with, model, months, horizon)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Forecast calculation failed: {e}")
 
 
+@app.get("/forecast/backtest")
+@cached
+async def backtest_production_forecast():
+    """
+    Evaluate the forecast over every historical month with a production
+    breakdown: each month is forecast from the months before it only, and
+    compared with the actual production. Returns the mean absolute error
+    (MAE, in heats) and the mean absolute percentage error (MAPE, in %),
+    overall, per product group, and per steel grade.
+    """
+
+    try:
+        return await run_in_session(backtest_forecast)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Forecast backtest failed: {e}")
+
+
 @app.get("/steel_grades")
-def get_steel_grades(db=Depends(get_db)):
+@cached
+async def get_steel_grades(db=Depends(get_async_db)):
     """Fetch all steel grades in the grades DB table."""
 
     try:
-        grades = db.query(Grade).all()
+        dimensions = await db.run_sync(get_dimensions)
         return [
             {
-                "id": grade.id,
-                "name": grade.name,
-                "group": grade.group.name if grade.group else None,
+                "id": grade_id,
+                "name": name,
+                "group": dimensions.group_names.get(
+                    dimensions.grade_groups.get(grade_id)
+                ),
             }
-            for grade in grades
+            for grade_id, name in sorted(dimensions.grade_names.items())
         ]
     except Exception as e:
         raise HTTPException(
@@ -167,18 +306,50 @@ def get_steel_grades(db=Depends(get_db)):
         )
 
 
+@app.put("/steel_grades/{name}")
+def set_steel_grade(name: str, tons_per_heat: float | None = None, db=Depends(get_db)):
+    """
+    Set the tons per heat of a steel grade, used to convert its production
+    to heats in the forecast. Without `tons_per_heat`, the grade uses the
+    default tons per heat again.
+    """
+
+    if tons_per_heat is not None and not tons_per_heat > 0:
+        msg = "The tons per heat must be positive."
+        raise HTTPException(status_code=400, detail=msg)
+    grade = db.execute(select(Grade).where(Grade.name == name)).scalar_one_or_none()
+    if grade is None:
+        raise HTTPException(status_code=404, detail=f"Steel grade '{name}' not found.")
+    try:
+        grade.tons_per_heat = tons_per_heat
+        db.commit()
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to update steel grade: {e}"
+        )
+    # the forecasts of the grade have changed
+    response_cache.bump()
+    return {
+        "id": grade.id,
+        "name": grade.name,
+        "group": grade.group.name if grade.group else None,
+        "tons_per_heat": tons_per_heat or TONS_PER_HEAT,
+    }
+
+
 @app.get("/product_groups")
-def get_product_groups(db=Depends(get_db)):
+@cached
+async def get_product_groups(db=Depends(get_async_db)):
     """Fetch all product groups in the groups DB table."""
 
     try:
-        groups = db.query(Group).all()
+        dimensions = await db.run_sync(get_dimensions)
         return [
             {
-                "id": group.id,
-                "group": group.name,
+                "id": group_id,
+                "group": name,
             }
-            for group in groups
+            for group_id, name in sorted(dimensions.group_names.items())
         ]
     except Exception as e:
         raise HTTPException(
@@ -186,87 +357,276 @@ def get_product_groups(db=Depends(get_db)):
         )
 
 
+def _parse_cursor(cursor: str) -> tuple[date, time | None]:
+    """Parse a `<date>T<time_start>` keyset cursor of the daily schedules."""
+    try:
+        date_str, _, time_str = cursor.partition("T")
+        return (
+            date.fromisoformat(date_str),
+            time.fromisoformat(time_str) if time_str else None,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: '{cursor}'.")
+
+
+SCHEDULE_SCHEMA = pa.schema(
+    [
+        ("date", pa.date32()),
+        ("time_start", pa.time64("us")),
+        ("grade", pa.string()),
+        ("mould_size", pa.string()),
+    ]
+)
+
+
+def _schedule_record(row, dimensions: DimensionCache) -> dict:
+    return {
+        "date": row.date.strftime("%Y-%m-%d"),
+        "time_start": row.time_start.strftime("%H:%M") if row.time_start else None,
+        "grade": dimensions.grade_names.get(row.grade_id),
+        "mould_size": row.mould_size,
+    }
+
+
+def _schedules_by_day(db: Session, query, limit: int | None) -> JSONResponse:
+    """
+    The heats of `query` grouped by day, with the cursor of the next page
+    in the `X-Next-Cursor` header if the page is full.
+    """
+    grade_names = get_dimensions(db).grade_names
+    schedules = db.execute(query).all()
+    count_rows(len(schedules))
+    result = {}
+    for sched in schedules:
+        date_str = sched.date.strftime("%Y-%m-%d")
+        if date_str not in result:
+            result[date_str] = []
+        result[date_str].append(
+            {
+                "time_start": (
+                    sched.time_start.strftime("%H:%M") if sched.time_start else None
+                ),
+                "grade": grade_names.get(sched.grade_id),
+                "mould_size": sched.mould_size,
+            }
+        )
+
+    headers = {}
+    if limit and len(schedules) == limit:
+        last = schedules[-1]
+        time_str = last.time_start.isoformat() if last.time_start else ""
+        headers["X-Next-Cursor"] = f"{last.date.isoformat()}T{time_str}"
+    return JSONResponse(result, headers=headers)
+
+
 @app.get("/daily_schedules")
-def get_daily_schedules(db=Depends(get_db)):
-    """Fetch the daily schedules from the daily_schedule DB table."""
+@cached
+async def get_daily_schedules(
+    start_date: date | None = None,
+    end_date: date | None = None,
+    cursor: str | None = None,
+    limit: int | None = Query(None, ge=1),
+    format: ExportFormat = "json",
+):
+    """
+    Fetch the daily schedules from the daily_schedule DB table, optionally
+    between `start_date` and `end_date` (inclusive). Results can be
+    paginated with `limit`: if there are more results, the `X-Next-Cursor`
+    response header holds the `cursor` to pass to fetch the next page.
+    With `format` set to `ndjson` or `csv`, one row per heat is streamed
+    instead, or with `arrow` or `parquet` one typed column per field.
+    """
 
-    try:
-        schedules = (
-            db.query(DailySchedule)
-            .order_by(DailySchedule.date, DailySchedule.time_start)
-            .all()
+    query = select(
+        DailySchedule.date,
+        DailySchedule.time_start,
+        DailySchedule.grade_id,
+        DailySchedule.mould_size,
+    ).order_by(DailySchedule.date, DailySchedule.time_start)
+    if start_date:
+        query = query.where(DailySchedule.date >= start_date)
+    if end_date:
+        query = query.where(DailySchedule.date <= end_date)
+    if cursor:
+        # keyset pagination: continue after the last (date, time_start)
+        last_date, last_time = _parse_cursor(cursor)
+        same_day = (
+            DailySchedule.time_start > last_time
+            if last_time
+            else DailySchedule.time_start.is_not(None)
         )
-        result = {}
-        for sched in schedules:
-            date_str = sched.date.strftime("%Y-%m-%d")
-            if date_str not in result:
-                result[date_str] = []
-            result[date_str].append(
-                {
-                    "time_start": sched.time_start.strftime("%H:%M")
-                    if sched.time_start
-                    else None,
-                    "grade": sched.grade.name if sched.grade else None,
-                    "mould_size": sched.mould_size,
-                }
+        query = query.where(
+            or_(
+                DailySchedule.date > last_date,
+                and_(DailySchedule.date == last_date, same_day),
             )
-        return result
+        )
+    if limit:
+        query = query.limit(limit)
+    if format != "json":
+        return stream_table(
+            query,
+            _schedule_record,
+            SCHEDULE_SCHEMA,
+            format,
+            "daily_schedules",
+        )
+
+    try:
+        return await run_in_session(_schedules_by_day, query, limit)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to fetch daily schedules: {e}"
         )
 
 
-@app.get("/monthly_plans")
-def get_monthly_plan(db=Depends(get_db)):
-    """Fetch monthly plans from the monthly_group_plan DB table."""
+def _parse_month(month: str | None, name: str) -> date | None:
+    """Parse a `YYYY-MM` query parameter to the first day of the month."""
+    if month is None:
+        return None
+    try:
+        return date.fromisoformat(f"{month}-01")
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid {name}: '{month}', expected YYYY-MM."
+        )
+
+
+@app.get("/daily_schedules/rollup")
+@cached
+async def get_daily_schedules_rollup(
+    start_month: str | None = None,
+    end_month: str | None = None,
+):
+    """
+    Fetch the heats scheduled each month per product group and steel grade,
+    optionally from `start_month` to `end_month` (`YYYY-MM`, inclusive),
+    compared with the heats planned for each group in that month. The
+    `variance` is the scheduled minus the planned heats of the group.
+    """
 
+    start = _parse_month(start_month, "start_month")
+    end = _parse_month(end_month, "end_month")
     try:
-        plans = (
-            db.query(MonthlyGroupPlan)
-            .order_by(MonthlyGroupPlan.month, MonthlyGroupPlan.group_id)
-            .all()
+        return await run_in_session(schedule_rollup, start, end)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to fetch daily schedules rollup: {e}"
         )
-        result = {}
-        for plan in plans:
-            month_str = plan.month.strftime("%Y-%m")
-            if month_str not in result:
-                result[month_str] = []
-            result[month_str].append(
-                {
-                    "group": plan.group.name if plan.group else None,
-                    "heats": plan.heats,
-                }
-            )
-        return result
+
+
+PLAN_SCHEMA = pa.schema(
+    [("month", pa.date32()), ("group", pa.string()), ("heats", pa.int64())]
+)
+
+
+def _plan_record(row, dimensions: DimensionCache) -> dict:
+    return {
+        "month": row.month.strftime("%Y-%m"),
+        "group": dimensions.group_names.get(row.group_id),
+        "heats": row.heats,
+    }
+
+
+def _plans_by_month(db: Session, query) -> dict:
+    """The plans of `query` grouped by month."""
+    group_names = get_dimensions(db).group_names
+    plans = db.execute(query).all()
+    count_rows(len(plans))
+    result = {}
+    for plan in plans:
+        month_str = plan.month.strftime("%Y-%m")
+        if month_str not in result:
+            result[month_str] = []
+        result[month_str].append(
+            {
+                "group": group_names.get(plan.group_id),
+                "heats": plan.heats,
+            }
+        )
+    return result
+
+
+@app.get("/monthly_plans")
+@cached
+async def get_monthly_plan(format: ExportFormat = "json"):
+    """
+    Fetch monthly plans from the monthly_group_plan DB table. With
+    `format` set to `ndjson` or `csv`, one row per plan is streamed instead,
+    or with `arrow` or `parquet` one typed column per field, the month as
+    its first day.
+    """
+
+    query = select(
+        MonthlyGroupPlan.month, MonthlyGroupPlan.group_id, MonthlyGroupPlan.heats
+    ).order_by(MonthlyGroupPlan.month, MonthlyGroupPlan.group_id)
+    if format != "json":
+        return stream_table(query, _plan_record, PLAN_SCHEMA, format, "monthly_plans")
+
+    try:
+        return await run_in_session(_plans_by_month, query)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to fetch monthly plans: {e}"
         )
 
 
+BREAKDOWN_SCHEMA = pa.schema(
+    [("month", pa.date32()), ("grade", pa.string()), ("tons", pa.int64())]
+)
+
+
+def _breakdown_record(row, dimensions: DimensionCache) -> dict:
+    return {
+        "month": row.month.strftime("%Y-%m"),
+        "grade": dimensions.grade_names.get(row.grade_id),
+        "tons": row.tons,
+    }
+
+
+def _breakdown_by_month(db: Session, query) -> dict:
+    """The production of the grades of `query` grouped by month."""
+    grade_names = get_dimensions(db).grade_names
+    breakdowns = db.execute(query).all()
+    count_rows(len(breakdowns))
+    result = {}
+    for b in breakdowns:
+        month_str = b.month.strftime("%Y-%m")
+        if month_str not in result:
+            result[month_str] = []
+        result[month_str].append(
+            {
+                "grade": grade_names.get(b.grade_id),
+                "tons": b.tons,
+            }
+        )
+    return result
+
+
 @app.get("/monthly_breakdown")
-def get_monthly_breakdown(db=Depends(get_db)):
-    """Fetch the monthly production breakdown from the monthly_breakdown DB table."""
+@cached
+async def get_monthly_breakdown(format: ExportFormat = "json"):
+    """
+    Fetch the monthly production breakdown from the monthly_breakdown DB
+    table. With `format` set to `ndjson` or `csv`, one row per grade and
+    month is streamed instead, or with `arrow` or `parquet` one typed
+    column per field, the month as its first day.
+    """
 
-    try:
-        breakdowns = (
-            db.query(MonthlyBreakdown)
-            .order_by(MonthlyBreakdown.month, MonthlyBreakdown.grade_id)
-            .all()
+    query = select(
+        MonthlyBreakdown.month, MonthlyBreakdown.grade_id, MonthlyBreakdown.tons
+    ).order_by(MonthlyBreakdown.month, MonthlyBreakdown.grade_id)
+    if format != "json":
+        return stream_table(
+            query,
+            _breakdown_record,
+            BREAKDOWN_SCHEMA,
+            format,
+            "monthly_breakdown",
         )
-        result = {}
-        for b in breakdowns:
-            month_str = b.month.strftime("%Y-%m")
-            if month_str not in result:
-                result[month_str] = []
-            result[month_str].append(
-                {
-                    "grade": b.grade.name if b.grade else None,
-                    "tons": b.tons,
-                }
-            )
-        return result
+
+    try:
+        return await run_in_session(_breakdown_by_month, query)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to fetch monthly breakdown: {e}"
@@ -275,5 +635,18 @@ def get_monthly_breakdown(db=Depends(get_db)):
 
 @app.on_event("startup")
 def startup_event():
-    """Initialize the database on startup."""
+    """
+    Initialize the database, the dimension cache and the grade ratios
+    used by the forecast on startup.
+    """
     init_db()
+    with SessionLocal() as db:
+        get_dimensions(db)
+        ensure_grade_ratios(db)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Wait for the running upload jobs on shutdown."""
+    job_manager.shutdown()
+    await async_engine.dispose()
@@ -0,0 +1,316 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+# upper bounds in seconds of the buckets of the duration histograms
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    """Format label names and values as in the Prometheus text format."""
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """A Prometheus counter, with a value per combination of labels."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labels, key)} {v}" for key, v in values]
+
+
+class Histogram(Counter):
+    """A Prometheus histogram of durations, per combination of labels."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self.buckets = DURATION_BUCKETS
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            # one count per bucket, and a last one for the values above them
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = sorted(
+                (key, (list(counts), total))
+                for key, (counts, total) in self._values.items()
+            )
+        samples = []
+        names = self.labels + ("le",)
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = _labels(names, key + (bound,))
+                samples.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labels, key)
+            samples.append(f"{self.name}_sum{labels} {total}")
+            samples.append(f"{self.name}_count{labels} {cumulative}")
+        return samples
+
+
+class Registry:
+    """The metrics exposed at `/metrics`."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        self.metrics.append(Counter(name, help, labels))
+        return self.metrics[-1]
+
+    def histogram(self, name: str, help: str, labels: tuple = ()) -> Histogram:
+        self.metrics.append(Histogram(name, help, labels))
+        return self.metrics[-1]
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total",
+    "Requests served, per endpoint and status code.",
+    ("method", "route", "status"),
+)
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds",
+    "Time until the response headers are sent, per endpoint.",
+    ("method", "route"),
+)
+http_request_sql_statements = registry.counter(
+    "http_request_sql_statements_total",
+    "SQL statements executed by the requests, per endpoint.",
+    ("method", "route"),
+)
+http_request_rows = registry.counter(
+    "http_request_rows_total",
+    "Rows processed by the requests, read from the database or parsed from "
+    "uploaded files, per endpoint.",
+    ("method", "route"),
+)
+sql_statements = registry.counter(
+    "sql_statements_total", "SQL statements executed by the app."
+)
+sql_seconds = registry.counter(
+    "sql_statement_seconds_total", "Time spent executing SQL statements."
+)
+ingest_files = registry.counter(
+    "ingest_files_total",
+    "Uploaded files, per parser and final status.",
+    ("parser", "status"),
+)
+ingest_rows_parsed = registry.counter(
+    "ingest_rows_parsed_total", "Rows read from the uploaded files.", ("parser",)
+)
+ingest_rows_written = registry.counter(
+    "ingest_rows_written_total",
+    "Rows written to the database by the uploads.",
+    ("parser",),
+)
+ingest_stage_seconds = registry.histogram(
+    "ingest_stage_duration_seconds",
+    "Time spent in each stage of the uploads: reading the workbook, "
+    "reshaping it with pandas, and writing it to the database.",
+    ("parser", "stage"),
+)
+ingest_stage_sql_statements = registry.counter(
+    "ingest_stage_sql_statements_total",
+    "SQL statements executed in each stage of the uploads.",
+    ("parser", "stage"),
+)
+
+
+class Stats:
+    """
+    Timings, SQL statements and rows processed of a request or an upload,
+    in total and per stage. The time of a stage excludes that of the
+    stages nested in it, and a statement counts towards the innermost
+    stage running it.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.stages = {}  # stage -> {"seconds": ..., "sql_statements": ...}
+        self._running = []  # [stage, start, time of nested stages]
+
+    @property
+    def seconds(self) -> float:
+        return time.perf_counter() - self.start
+
+    def add(self, other: "Stats"):
+        """Add the SQL statements, the rows and the stages of `other`."""
+        self.sql_statements += other.sql_statements
+        self.sql_seconds += other.sql_seconds
+        self.rows += other.rows
+        for name, stage in other.stages.items():
+            total = self.stages.setdefault(name, {"seconds": 0.0, "sql_statements": 0})
+            total["seconds"] += stage["seconds"]
+            total["sql_statements"] += stage["sql_statements"]
+
+    def server_timing(self) -> str:
+        """The stats as the value of a `Server-Timing` header, in milliseconds."""
+        sql = f"sql;dur={self.sql_seconds * 1000:.1f}"
+        metrics = [
+            f"total;dur={self.seconds * 1000:.1f}",
+            f'{sql};desc="statements: {self.sql_statements}"',
+        ]
+        if self.rows:
+            metrics.append(f'rows;desc="{self.rows}"')
+        for name, stage in self.stages.items():
+            metrics.append(f"{name};dur={stage['seconds'] * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+_stats: ContextVar[Stats | None] = ContextVar("stats", default=None)
+
+
+@contextmanager
+def collect():
+    """
+    Collect the stats of the code run in the block, in the current thread
+    or task and those it starts. Yields the `Stats`, which are also added
+    to those of an enclosing block.
+    """
+    parent = _stats.get()
+    stats = Stats()
+    token = _stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _stats.reset(token)
+        if parent is not None:
+            parent.add(stats)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a stage of the current request or upload, and count its SQL
+    statements. Also usable as a decorator. Does nothing if the stats of
+    the running code are not collected.
+    """
+    stats = _stats.get()
+    if stats is None:
+        yield
+        return
+    stats.stages.setdefault(name, {"seconds": 0.0, "sql_statements": 0})
+    stats._running.append([name, time.perf_counter(), 0.0])
+    try:
+        yield
+    finally:
+        name, start, nested = stats._running.pop()
+        elapsed = time.perf_counter() - start
+        stats.stages[name]["seconds"] += elapsed - nested
+        if stats._running:
+            stats._running[-1][2] += elapsed
+
+
+def count_rows(rows: int):
+    """
+    Count rows processed by the current request or upload, read from the
+    database or parsed from a file. Does nothing if the stats of the
+    running code are not collected.
+    """
+    stats = _stats.get()
+    if stats is not None:
+        stats.rows += rows
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    if context is not None:
+        context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    start = getattr(context, "_metrics_start", None)
+    elapsed = 0.0 if start is None else time.perf_counter() - start
+    sql_statements.inc()
+    sql_seconds.inc(elapsed)
+    stats = _stats.get()
+    if stats is not None:
+        stats.sql_statements += 1
+        stats.sql_seconds += elapsed
+        if stats._running:
+            stats.stages[stats._running[-1][0]]["sql_statements"] += 1
+
+
+def instrument_engine(engine):
+    """Count and time the SQL statements executed through `engine`."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def observe_request(method: str, route: str, status: int, stats: Stats):
+    """Record the stats of a request served by the API, once its headers are sent."""
+    http_requests.inc(method=method, route=route, status=status)
+    http_request_seconds.observe(stats.seconds, method=method, route=route)
+    http_request_sql_statements.inc(stats.sql_statements, method=method, route=route)
+
+
+def observe_rows(method: str, route: str, stats: Stats):
+    """
+    Record the rows processed by a request, once its body is sent, so that
+    the rows of streamed responses are counted too.
+    """
+    http_request_rows.inc(stats.rows, method=method, route=route)
+
+
+def observe_ingest(
+    parser: str,
+    status: str,
+    stages: dict,
+    rows_parsed: int | None = None,
+    rows_written: int | None = None,
+):
+    """Record the stages and the rows of an uploaded file."""
+    ingest_files.inc(parser=parser, status=status)
+    ingest_rows_parsed.inc(rows_parsed or 0, parser=parser)
+    ingest_rows_written.inc(rows_written or 0, parser=parser)
+    for name, stage_stats in stages.items():
+        ingest_stage_seconds.observe(stage_stats["seconds"], parser=parser, stage=name)
+        ingest_stage_sql_statements.inc(
+            stage_stats["sql_statements"], parser=parser, stage=name
+        )
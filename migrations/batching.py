@@ -0,0 +1,92 @@
+"""
+Helpers for migrations of large tables, e.g. a multi-million-row
+'daily_schedule', so that they don't hold a lock on the database for
+the whole migration.
+"""
+
+import logging
+import os
+import time
+
+from alembic import op
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# number of rows, by range of ids, updated or copied per transaction
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "50000"))
+# seconds to wait between batches, so that waiting writers get the lock
+MIGRATION_BATCH_PAUSE = float(os.getenv("MIGRATION_BATCH_PAUSE", "0.05"))
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+
+def execute_in_batches(
+    connection: Connection,
+    sql: str,
+    table: str,
+    batch_size: int = MIGRATION_BATCH_SIZE,
+    pause: float = MIGRATION_BATCH_PAUSE,
+) -> int:
+    """
+    Execute `sql` once per range of `batch_size` ids of `table`, with the
+    range bound to the `:start` (inclusive) and `:end` (exclusive)
+    parameters, e.g.
+
+        UPDATE monthly_breakdown SET tons = tons * 0.907
+        WHERE id >= :start AND id < :end
+
+    The connection must be in autocommit mode, so that each batch commits
+    on its own, and it pauses for `pause` seconds between batches so that
+    other connections can write in between. Returns the number of batches.
+    """
+    first, last = connection.execute(
+        text(f"SELECT min(id), max(id) FROM {table}")
+    ).one()
+    if first is None:
+        return 0
+    batches = 0
+    for start in range(first, last + 1, batch_size):
+        if batches:
+            time.sleep(pause)
+        connection.execute(text(sql), {"start": start, "end": start + batch_size})
+        batches += 1
+        logger.info(
+            "%s: batch %d, ids up to %d", table, batches, start + batch_size - 1
+        )
+    return batches
+
+
+def run_in_batches(
+    sql: str,
+    table: str,
+    batch_size: int = MIGRATION_BATCH_SIZE,
+    pause: float = MIGRATION_BATCH_PAUSE,
+) -> int:
+    """
+    Run a data migration over `table` in batches, see `execute_in_batches`.
+    For use in the `upgrade` or `downgrade` of a migration: the changes of
+    the migration made before it are committed first.
+    """
+    with op.get_context().autocommit_block():
+        return execute_in_batches(op.get_bind(), sql, table, batch_size, pause)
+
+
+def create_index_online(index_name: str, table_name: str, columns: list[str], **kw):
+    """
+    Create an index without blocking writes to the table while it is
+    built: on PostgreSQL with `CREATE INDEX CONCURRENTLY`, which can't run
+    in a transaction. SQLite has no equivalent, the index is created as
+    usual.
+    """
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.create_index(
+                index_name,
+                table_name,
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+                **kw,
+            )
+    else:
+        op.create_index(index_name, table_name, columns, if_not_exists=True, **kw)
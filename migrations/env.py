@@ -0,0 +1,57 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+from engine import engine
+from models import Base
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    """Emit the migrations as SQL to the script output, without connecting."""
+    context.configure(
+        url=engine.url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=engine.dialect.name == "sqlite",
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def _run(connection):
+    # SQLite can't alter most constraints in place, batch mode recreates the
+    # table. Each migration commits on its own, so that data migrations can
+    # commit in batches (see migrations/batching.py).
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        render_as_batch=connection.dialect.name == "sqlite",
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    """
+    Run the migrations against the database of the app. A connection
+    passed by `init_db` in the config attributes is reused.
+    """
+    connection = context.config.attributes.get("connection")
+    if connection is None:
+        # run from the alembic command line
+        fileConfig(context.config.config_file_name, disable_existing_loggers=False)
+        with engine.connect() as connection:
+            _run(connection)
+    else:
+        _run(connection)
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
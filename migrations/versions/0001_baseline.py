@@ -0,0 +1,123 @@
+"""Baseline: the tables created by `Base.metadata.create_all` before migrations
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # a database created before migrations already has some of the tables
+    op.create_table(
+        "groups",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=20), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "uploads",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("parser", sa.String(length=50), nullable=False),
+        sa.Column("filename", sa.String(length=255), nullable=False),
+        sa.Column("content_hash", sa.String(length=64), nullable=False),
+        sa.Column("rows_written", sa.Integer(), nullable=False),
+        sa.Column(
+            "uploaded_at", sa.DateTime(), server_default=sa.func.now(), nullable=False
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "grades",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=20), nullable=False),
+        sa.Column("group_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["group_id"],
+            ["groups.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "monthly_group_plan",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("group_id", sa.Integer(), nullable=True),
+        sa.Column("heats", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["group_id"],
+            ["groups.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("month", "group_id", name="unique_group_per_month"),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "daily_schedule",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("time_start", sa.Time(), nullable=True),
+        sa.Column("grade_id", sa.Integer(), nullable=False),
+        sa.Column("mould_size", sa.String(length=20), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["grade_id"],
+            ["grades.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("date", "time_start", name="unique_heat_per_day"),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "grade_ratios",
+        sa.Column("grade_id", sa.Integer(), nullable=False),
+        sa.Column("ratio_sum", sa.Float(), nullable=False),
+        sa.Column("ratio_count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["grade_id"],
+            ["grades.id"],
+        ),
+        sa.PrimaryKeyConstraint("grade_id"),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "monthly_breakdown",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("grade_id", sa.Integer(), nullable=False),
+        sa.Column("tons", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["grade_id"],
+            ["grades.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("month", "grade_id", name="unique_grade_per_month"),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("monthly_breakdown")
+    op.drop_table("grade_ratios")
+    op.drop_table("daily_schedule")
+    op.drop_table("monthly_group_plan")
+    op.drop_table("grades")
+    op.drop_table("uploads")
+    op.drop_table("groups")
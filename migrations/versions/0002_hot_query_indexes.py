@@ -0,0 +1,44 @@
+"""Add indexes for the hot queries of the forecast and the uploads
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # a database created before migrations may have some of the indexes
+    op.create_index("ix_grades_group_id", "grades", ["group_id"], if_not_exists=True)
+    op.create_index(
+        "ix_monthly_breakdown_grade_id_month",
+        "monthly_breakdown",
+        ["grade_id", "month"],
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_monthly_group_plan_group_id_month",
+        "monthly_group_plan",
+        ["group_id", "month"],
+        if_not_exists=True,
+    )
+    op.create_index("ix_uploads_parser", "uploads", ["parser"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_uploads_parser", "uploads")
+    op.drop_index("ix_monthly_group_plan_group_id_month", "monthly_group_plan")
+    op.drop_index("ix_monthly_breakdown_grade_id_month", "monthly_breakdown")
+    op.drop_index("ix_grades_group_id", "grades")
@@ -0,0 +1,56 @@
+"""Add the monthly rollup of the daily schedule, and backfill it
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.batching import run_in_batches
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# first day of the month of a heat, for each backend
+MONTH = {
+    "sqlite": "date(date, 'start of month')",
+    "postgresql": "CAST(date_trunc('month', date) AS DATE)",
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "monthly_schedule_rollup",
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("grade_id", sa.Integer(), nullable=False),
+        sa.Column("heats", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["grade_id"], ["grades.id"]),
+        sa.PrimaryKeyConstraint("month", "grade_id"),
+    )
+    # the heats of a month may span several batches, so counts are added up
+    month = MONTH[op.get_bind().dialect.name]
+    run_in_batches(
+        f"""
+        INSERT INTO monthly_schedule_rollup (month, grade_id, heats)
+        SELECT {month}, grade_id, count(id) FROM daily_schedule
+        WHERE id >= :start AND id < :end
+        GROUP BY {month}, grade_id
+        ON CONFLICT (month, grade_id)
+        DO UPDATE SET heats = monthly_schedule_rollup.heats + excluded.heats
+        """,
+        "daily_schedule",
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("monthly_schedule_rollup")
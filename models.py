@@ -1,5 +1,17 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Date, Time, UniqueConstraint
+from sqlalchemy import (
+    Column,
+    Integer,
+    Float,
+    String,
+    ForeignKey,
+    Date,
+    DateTime,
+    Index,
+    Time,
+    UniqueConstraint,
+)
 from sqlalchemy.orm import DeclarativeBase, relationship
+from sqlalchemy.sql import func
 
 
 class Base(DeclarativeBase):
@@ -28,7 +40,9 @@ class Grade(Base):
 
     id = Column(Integer, primary_key=True)
     name = Column(String(20), nullable=False, unique=True)
-    group_id = Column(Integer, ForeignKey("groups.id"), nullable=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=True, index=True)
+    # tons of the grade per heat, if not the default of the forecast
+    tons_per_heat = Column(Float, nullable=True)
 
     group = relationship("Group", back_populates="grades")
     heats = relationship("DailySchedule", back_populates="grade")
@@ -72,6 +86,8 @@ class MonthlyGroupPlan(Base):
     __tablename__ = "monthly_group_plan"
     __table_args__ = (
         UniqueConstraint("month", "group_id", name="unique_group_per_month"),
+        # plans of a group, e.g. its last planned month
+        Index("ix_monthly_group_plan_group_id_month", "group_id", "month"),
     )
 
     id = Column(Integer, primary_key=True)
@@ -98,6 +114,8 @@ class MonthlyBreakdown(Base):
     __tablename__ = "monthly_breakdown"
     __table_args__ = (
         UniqueConstraint("month", "grade_id", name="unique_grade_per_month"),
+        # history of a grade, e.g. to refresh its ratio
+        Index("ix_monthly_breakdown_grade_id_month", "grade_id", "month"),
     )
 
     id = Column(Integer, primary_key=True)
@@ -113,3 +131,74 @@ class MonthlyBreakdown(Base):
             f"grade='{self.grade}', "
             f"tons='{self.tons}')>"
         )
+
+
+class MonthlyScheduleRollup(Base):
+    """
+    Table to store the number of heats scheduled each month for each
+    steel grade, aggregated from the 'daily_schedule' table. Kept up to
+    date by the parsers so that monthly totals don't need to scan every
+    heat.
+    """
+
+    __tablename__ = "monthly_schedule_rollup"
+
+    month = Column(Date, primary_key=True)
+    grade_id = Column(Integer, ForeignKey("grades.id"), primary_key=True)
+    heats = Column(Integer, nullable=False)
+
+    grade = relationship("Grade")
+
+    def __repr__(self):
+        return (
+            f"<MonthlyScheduleRollup(month='{self.month}', "
+            f"grade='{self.grade}', "
+            f"heats='{self.heats}')>"
+        )
+
+
+class GradeRatio(Base):
+    """
+    Table to store, for each steel grade with production history,
+    the sum and count of its monthly production ratios (tons produced
+    per heat planned for its group). Kept up to date by the parsers
+    so that forecasts don't need to scan the full history.
+    """
+
+    __tablename__ = "grade_ratios"
+
+    grade_id = Column(Integer, ForeignKey("grades.id"), primary_key=True)
+    ratio_sum = Column(Float, nullable=False)
+    ratio_count = Column(Integer, nullable=False)
+
+    grade = relationship("Grade")
+
+    def __repr__(self):
+        return (
+            f"<GradeRatio(grade='{self.grade}', "
+            f"ratio_sum='{self.ratio_sum}', "
+            f"ratio_count='{self.ratio_count}')>"
+        )
+
+
+class Upload(Base):
+    """
+    Table to store a ledger of the Excel files ingested, with a hash
+    of their contents to skip re-uploads of unchanged files.
+    """
+
+    __tablename__ = "uploads"
+
+    id = Column(Integer, primary_key=True)
+    parser = Column(String(50), nullable=False, index=True)
+    filename = Column(String(255), nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    rows_written = Column(Integer, nullable=False)
+    uploaded_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return (
+            f"<Upload(parser='{self.parser}', "
+            f"filename='{self.filename}', "
+            f"content_hash='{self.content_hash}')>"
+        )
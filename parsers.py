@@ -1,28 +1,157 @@
 import pandas as pd
 from io import BytesIO
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 
+from dimensions import get_dimensions
+from forecast import refresh_grade_ratios
+from metrics import stage
 from models import Grade, DailySchedule, Group, MonthlyGroupPlan, MonthlyBreakdown
+from readers import read_excel
+from rollups import refresh_schedule_rollup
+
+
+def _excel_source(contents: bytes | str):
+    """The Excel file to read: the path of a file, or its contents in memory."""
+    return BytesIO(contents) if isinstance(contents, bytes) else contents
+
+
+def _records(df: pd.DataFrame) -> list[dict]:
+    """Convert a DataFrame to a list of records with NaN values as None."""
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict("records")
+
+
+def _insert(db: Session, model):
+    """
+    `INSERT` statement for the table of `model` in the dialect of the
+    database, so that `ON CONFLICT` clauses compile for its backend.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def _get_ids(db: Session, model, names: list[str]) -> dict:
+    """
+    Map each name to its id in the table of `model` (`Group` or `Grade`).
+    Names are looked up in the dimension cache first, and the names
+    missing from the database are inserted in a single batch.
+    """
+    ids = get_dimensions(db).ids(model, names)
+    missing = [name for name in names if name not in ids]
+    if missing:
+        ids.update(
+            db.execute(
+                select(model.name, model.id).where(model.name.in_(missing))
+            ).all()
+        )
+        missing = [name for name in missing if name not in ids]
+    if missing:
+        db.execute(_insert(db, model), [{"name": name} for name in missing])
+        ids.update(
+            db.execute(
+                select(model.name, model.id).where(model.name.in_(missing))
+            ).all()
+        )
+    return ids
+
+
+def _upsert(db: Session, model, records: list[dict], index_elements: list[str]):
+    """
+    Bulk `INSERT ... ON CONFLICT DO UPDATE` of `records` into the table
+    of `model`, where `index_elements` are the columns of the unique
+    constraint and all other columns are updated on conflict.
+    """
+    if not records:
+        return
+    # a statement may not update the same row twice on PostgreSQL, so only
+    # the last of the records with the same (non-null) key is kept
+    deduped = {}
+    for i, record in enumerate(records):
+        key = tuple(record[column] for column in index_elements)
+        deduped[i if None in key else key] = record
+    records = list(deduped.values())
+    stmt = _insert(db, model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={
+            column: stmt.excluded[column]
+            for column in records[0]
+            if column not in index_elements
+        },
+    )
+    db.execute(stmt, records)
+
+
+def _diff_rows(db: Session, model, rows: pd.DataFrame, keys: list[str], *filters):
+    """
+    Compare the rows with the ones stored in the table of `model`, matched
+    on the `keys` columns. The stored rows are loaded in one query
+    restricted by `filters`. Returns the rows that are new or differ from
+    the stored ones, and the stored rows (with their `id`) that are
+    missing from `rows`.
+    """
+    columns = [getattr(model, column) for column in rows.columns]
+    stored = pd.read_sql(select(model.id, *columns).where(*filters), db.connection())
+    merged = rows.merge(
+        stored, on=keys, how="left", suffixes=("", "_stored"), indicator=True
+    )
+    changed = merged["_merge"] == "left_only"
+    for column in rows.columns.difference(keys):
+        new, old = merged[column], merged[f"{column}_stored"]
+        changed |= ~((new == old) | (new.isna() & old.isna()))
+    missing = stored.merge(rows[keys], on=keys, how="left", indicator=True)
+    return (
+        rows[changed.to_numpy()],
+        stored[(missing["_merge"] == "left_only").to_numpy()],
+    )
+
+
+def _changed_rows(db: Session, model, rows: pd.DataFrame, keys: list[str], *filters):
+    """
+    Keep the rows that are new or differ from the ones stored in the table
+    of `model`, matched on the `keys` columns. The stored rows are loaded
+    in one query restricted by `filters`, so that unchanged rows of a
+    re-uploaded file are not written again.
+    """
+    if rows.empty:
+        return rows
+    return _diff_rows(db, model, rows, keys, *filters)[0]
 
 
 class DailyScheduleParser:
     """
-    Parser for the `daily_charge_schedule.xlsx` file.
+    Parser for the `daily_charge_schedule.xlsx` file. With `replace`, the
+    file replaces the schedule of the days it covers: the stored heats of
+    those days that are not in the file are deleted.
     """
 
-    def __init__(self, contents: bytes, db: Session):
+    def __init__(self, contents: bytes | str, db: Session, replace: bool = False):
         self.contents = contents
         self.db = db
+        self.replace = replace
+        self.rows_written = 0
 
+    @property
+    def rows_parsed(self) -> int:
+        """Number of heats read from the Excel file."""
+        return len(self.df)
+
+    @stage("reshape")
     def _read_excel(self):
         """
         Read Excel file and Perform Pandas pre-processing to obtain
         a DataFrame with columns: ["Date", "Start time", "Grade", "Mould size"]
+        The first and last dates of the sheet's header are kept in
+        `df.attrs["dates"]`, as the days without any heat are dropped.
         """
         try:
-            df = pd.read_excel(
-                BytesIO(self.contents), header=[1, 2], na_values=["-", "N/A", ""]
+            df = read_excel(
+                _excel_source(self.contents), header=[1, 2], na_values=["-", "N/A", ""]
             )
+            dates = pd.to_datetime(df.columns.get_level_values(0).unique())
             df = df.stack(level=0, future_stack=True)
             df["Start time"] = pd.to_datetime(df["Start time"], errors="coerce").dt.time
             df.index.set_names([None, "Date"], inplace=True)
@@ -30,44 +159,69 @@ class DailyScheduleParser:
             df.sort_values(["Date", "Start time"], inplace=True)
             df.dropna(subset=["Start time", "Grade"], inplace=True)
             df.reset_index(drop=True, inplace=True)
+            df.attrs["dates"] = (dates.min().date(), dates.max().date())
             self.df = df
         except Exception as e:
             msg = f"Error pre-processing the Excel file for daily schedule: {e}"
             raise ValueError(msg) from e
 
-    def _add_to_db(self):
+    @stage("write")
+    def _add_to_db(self, commit: bool = True):
         """
-        Iterates through the rows of the DataFrame and adds entries
-        to the 'grades' and 'daily_schedule' database tables. If a
-        matching entry already exists in the 'daily_schedule' table,
-        it updates it.
+        Adds entries to the 'grades' and 'daily_schedule' database
+        tables in a single transaction. Grade names are resolved in
+        one query and the heats that are new or changed are written
+        with one bulk `INSERT ... ON CONFLICT DO UPDATE` statement, so
+        that matching entries in the 'daily_schedule' table are updated.
+        With `replace`, the stored heats of the days from the first to the
+        last day of the file, including days without any heat, are compared
+        with the file in the same query, and those missing from the file
+        are deleted in bulk; the deleted heats count as written. The monthly rollup of the months with
+        written heats is refreshed.
+        With `commit=False` the transaction is left open, and the caller
+        must commit it and then call `_update_dimensions`.
         """
-        for _, row in self.df.iterrows():
-            grade_name = row["Grade"].strip()
-            grade = self.db.query(Grade).filter_by(name=grade_name).first()
-            if not grade:
-                # if grade not in "grades" table, add it
-                grade = Grade(name=grade_name)
-                self.db.add(grade)
-                self.db.commit()
-
-            schedule = (
-                self.db.query(DailySchedule)
-                .filter_by(date=row["Date"], time_start=row["Start time"])
-                .first()
+        df = self.df
+        grades = df["Grade"].str.strip()
+        grade_ids = _get_ids(self.db, Grade, grades.unique().tolist())
+        rows = pd.DataFrame(
+            {
+                "date": pd.to_datetime(df["Date"]).dt.date,
+                "time_start": df["Start time"],
+                "grade_id": grades.map(grade_ids),
+                "mould_size": df["Mould size"].str.strip(),
+            }
+        )
+        stale = rows.iloc[:0]
+        if self.replace or not rows.empty:
+            first, last = df.attrs["dates"]
+            rows, stale = _diff_rows(
+                self.db,
+                DailySchedule,
+                rows,
+                ["date", "time_start"],
+                DailySchedule.date.between(first, last),
             )
-            if schedule:
-                schedule.grade_id = grade.id
-                schedule.mould_size = row["Mould size"].strip()
-            else:
-                schedule = DailySchedule(
-                    date=row["Date"],
-                    time_start=row["Start time"],
-                    grade_id=grade.id,
-                    mould_size=row["Mould size"].strip(),
-                )
-                self.db.add(schedule)
+        if not self.replace:
+            stale = stale.iloc[:0]
+        if not stale.empty:
+            self.db.execute(
+                delete(DailySchedule).where(DailySchedule.id.in_(stale["id"].tolist()))
+            )
+        _upsert(self.db, DailySchedule, _records(rows), ["date", "time_start"])
+        self.rows_written = len(rows) + len(stale)
+        if self.rows_written:
+            days = pd.concat([rows["date"], stale["date"]])
+            months = {day.replace(day=1) for day in days}
+            refresh_schedule_rollup(self.db, months)
+        self._grade_ids = grade_ids
+        if commit:
             self.db.commit()
+            self._update_dimensions()
+
+    def _update_dimensions(self):
+        """Add the grades of the committed upload to the dimension cache."""
+        get_dimensions(self.db).add(Grade, self._grade_ids)
 
     def __call__(self):
         self._read_excel()
@@ -79,10 +233,17 @@ class MonthlyGroupParser:
     Parser for the `product_groups_monthly.xlsx` file.
     """
 
-    def __init__(self, contents: bytes, db: Session):
+    def __init__(self, contents: bytes | str, db: Session):
         self.contents = contents
         self.db = db
+        self.rows_written = 0
+
+    @property
+    def rows_parsed(self) -> int:
+        """Number of monthly group plans read from the Excel file."""
+        return self.df.size
 
+    @stage("reshape")
     def _read_excel(self):
         """
         Read Excel file and perform Pandas pre-processing to obtain
@@ -90,8 +251,8 @@ class MonthlyGroupParser:
         indexed by date.
         """
         try:
-            df = pd.read_excel(
-                BytesIO(self.contents), header=1, na_values=["-", "N/A", ""]
+            df = read_excel(
+                _excel_source(self.contents), header=1, na_values=["-", "N/A", ""]
             )
             df.set_index(df.columns[0], inplace=True)
             df = df.transpose()
@@ -104,36 +265,47 @@ class MonthlyGroupParser:
             msg = f"Error pre-processing the Excel file for monthly group plan: {e}"
             raise ValueError(msg) from e
 
-    def _add_to_db(self):
+    @stage("write")
+    def _add_to_db(self, commit: bool = True):
         """
-        Adds new quality groups to to the 'groups' table and
-        monthly group plans to the 'monthly_group_plan' table
-        by looping through the pre-processed DataFrame. If a
-        matching entry already exists in the 'monthly_group_plan'
-        table, it updates it.
+        Adds new quality groups to the 'groups' table and monthly
+        group plans to the 'monthly_group_plan' table in a single
+        transaction. The pre-processed DataFrame is melted into
+        (month, group, heats) rows, and the new or changed ones are
+        upserted in bulk, updating matching entries in the
+        'monthly_group_plan' table.
+        With `commit=False` the transaction is left open, and the caller
+        must commit it and then call `_update_dimensions`.
         """
+        df = self.df.rename(columns=lambda name: name.strip())
+        group_ids = _get_ids(self.db, Group, df.columns.unique().tolist())
+        rows = df.melt(ignore_index=False, var_name="group", value_name="heats")
+        rows = pd.DataFrame(
+            {
+                "month": rows.index.date,
+                "group_id": rows["group"].map(group_ids).to_numpy(),
+                "heats": rows["heats"].to_numpy(),
+            }
+        )
+        rows = _changed_rows(
+            self.db,
+            MonthlyGroupPlan,
+            rows,
+            ["month", "group_id"],
+            MonthlyGroupPlan.month.between(rows["month"].min(), rows["month"].max()),
+        )
+        _upsert(self.db, MonthlyGroupPlan, _records(rows), ["month", "group_id"])
+        self.rows_written = len(rows)
+        if not rows.empty:
+            refresh_grade_ratios(self.db, group_ids=rows["group_id"].unique().tolist())
+        self._group_ids = group_ids
+        if commit:
+            self.db.commit()
+            self._update_dimensions()
 
-        for group_name in self.df.columns:
-            group = self.db.query(Group).filter_by(name=group_name.strip()).first()
-            if not group:
-                # if group not in "groups" table, add it
-                group = Group(name=group_name.strip())
-                self.db.add(group)
-                self.db.commit()
-            for month, heats in self.df[group_name].items():
-                monthly_plan = (
-                    self.db.query(MonthlyGroupPlan)
-                    .filter_by(month=month.date(), group=group)
-                    .first()
-                )
-                if monthly_plan:
-                    monthly_plan.heats = heats
-                else:
-                    monthly_plan = MonthlyGroupPlan(
-                        month=month.date(), group_id=group.id, heats=heats
-                    )
-                    self.db.add(monthly_plan)
-                self.db.commit()
+    def _update_dimensions(self):
+        """Add the groups of the committed upload to the dimension cache."""
+        get_dimensions(self.db).add(Group, self._group_ids)
 
     def __call__(self):
         self._read_excel()
@@ -145,10 +317,17 @@ class SteelProductionParser:
     Parser for the `steel_grade_production.xlsx` file.
     """
 
-    def __init__(self, contents: bytes, db: Session):
+    def __init__(self, contents: bytes | str, db: Session):
         self.contents = contents
         self.db = db
+        self.rows_written = 0
 
+    @property
+    def rows_parsed(self) -> int:
+        """Number of monthly grade breakdowns read from the Excel file."""
+        return self.df.size
+
+    @stage("reshape")
     def _read_excel(self):
         """
         Read Excel file and perform Pandas pre-processing to obtain
@@ -156,7 +335,7 @@ class SteelProductionParser:
         by date.
         """
         try:
-            df = pd.read_excel(BytesIO(self.contents), header=1)
+            df = read_excel(_excel_source(self.contents), header=1)
             df = df.dropna(axis=1, how="all")
             df["Quality group"] = df["Quality group"].ffill()
             df = df.set_index(["Quality group", "Grade"])
@@ -168,49 +347,97 @@ class SteelProductionParser:
             msg = f"Error pre-processing the Excel file for steel production breakdown: {e}"
             raise ValueError(msg) from e
 
-    def _add_to_db(self):
+    @stage("write")
+    def _add_to_db(self, commit: bool = True):
         """
         Adds new quality groups and steel grades to the 'groups'
         and 'grades' tables, respectively, if they don't exist.
-        If a grade already exists, it updates the its group. Adds
+        If a grade already exists, it updates its group. Adds
         tons of steel produced to the 'monthly_breakdown' table, updating
         the tons if an entry already exists for a given month and
-        steel grade.
+        steel grade. The pre-processed DataFrame is melted into
+        (month, grade, tons) rows, and the new or changed grades and
+        rows are written in bulk in a single transaction.
+        With `commit=False` the transaction is left open, and the caller
+        must commit it and then call `_update_dimensions`.
         """
+        df = self.df.rename(columns=lambda name: name.strip())
+        group_names = df.columns.get_level_values(0)
+        grade_names = df.columns.get_level_values(1)
+        group_ids = _get_ids(self.db, Group, group_names.unique().tolist())
+
+        grades = [
+            {"name": grade_name, "group_id": group_ids[group_name]}
+            for group_name, grade_name in zip(group_names, grade_names)
+        ]
+        stored_groups = dict(
+            self.db.execute(
+                select(Grade.name, Grade.group_id).where(
+                    Grade.name.in_(grade_names.unique().tolist())
+                )
+            ).all()
+        )
+        changed_grades = [
+            grade
+            for grade in grades
+            if grade["name"] not in stored_groups
+            or stored_groups[grade["name"]] != grade["group_id"]
+        ]
+        _upsert(self.db, Grade, changed_grades, ["name"])
+        grade_ids = _get_ids(self.db, Grade, grade_names.unique().tolist())
+
+        df.columns = grade_names
+        rows = df.melt(ignore_index=False, var_name="grade", value_name="tons")
+        rows = pd.DataFrame(
+            {
+                "month": rows.index.date,
+                "grade_id": rows["grade"].map(grade_ids).to_numpy(),
+                "tons": rows["tons"].to_numpy(),
+            }
+        )
+        rows = _changed_rows(
+            self.db,
+            MonthlyBreakdown,
+            rows,
+            ["month", "grade_id"],
+            MonthlyBreakdown.month.between(rows["month"].min(), rows["month"].max()),
+        )
+        _upsert(self.db, MonthlyBreakdown, _records(rows), ["month", "grade_id"])
+        self.rows_written = len(rows)
+
+        # ratios change with the tons of a grade and with its group
+        changed_ids = set(rows["grade_id"])
+        changed_ids |= {grade_ids[grade["name"]] for grade in changed_grades}
+        if changed_ids:
+            refresh_grade_ratios(self.db, grade_ids=changed_ids)
+        self._group_ids = group_ids
+        self._grade_ids = grade_ids
+        self._grade_groups = {
+            grade_ids[grade["name"]]: grade["group_id"] for grade in grades
+        }
+        if commit:
+            self.db.commit()
+            self._update_dimensions()
 
-        groups = self.df.columns.get_level_values(0).unique()
-
-        for group_name in groups:
-            group = self.db.query(Group).filter_by(name=group_name.strip()).first()
-            if not group:
-                group = Group(name=group_name.strip())
-                self.db.add(group)
-                self.db.commit()
-            for grade_name in self.df[group_name].columns:
-                grade = self.db.query(Grade).filter_by(name=grade_name.strip()).first()
-                if grade:
-                    grade.group = group
-                else:
-                    grade = Grade(name=grade_name.strip(), group=group)
-                    self.db.add(grade)
-                self.db.commit()
-                for month, tons in self.df[group_name, grade_name].items():
-                    monthly_breakdown = (
-                        self.db.query(MonthlyBreakdown)
-                        .filter_by(month=month.date(), grade=grade)
-                        .first()
-                    )
-                    if monthly_breakdown:
-                        monthly_breakdown.tons = tons
-                    else:
-                        monthly_breakdown = MonthlyBreakdown(
-                            month=month.date(),
-                            grade_id=grade.id,
-                            tons=tons,
-                        )
-                        self.db.add(monthly_breakdown)
-                    self.db.commit()
+    def _update_dimensions(self):
+        """
+        Add the groups and grades of the committed upload to the dimension
+        cache, and record the group of each grade.
+        """
+        dimensions = get_dimensions(self.db)
+        dimensions.add(Group, self._group_ids)
+        dimensions.set_grade_groups(self._grade_groups)
+        dimensions.add(Grade, self._grade_ids)
 
     def __call__(self):
         self._read_excel()
         self._add_to_db()
+
+
+# parser of each Excel file, by the name that the filename must contain, in
+# the order in which uploads are applied: groups and grades come first
+PARSERS = {
+    "steel_grade_production": SteelProductionParser,
+    "product_groups_monthly": MonthlyGroupParser,
+    "daily_charge_schedule": DailyScheduleParser,
+}
@@ -0,0 +1,44 @@
+import importlib.util
+import os
+import warnings
+
+import pandas as pd
+
+from metrics import stage
+
+# engines that pandas can use to read `.xlsx` files: "calamine" is a fast
+# reader written in Rust (requires `python-calamine`), "openpyxl" is pure
+# Python and builds a full object model of the workbook
+EXCEL_ENGINES = ("calamine", "openpyxl")
+EXCEL_ENGINE = os.getenv("EXCEL_ENGINE", "calamine")
+
+
+def _available(engine: str) -> bool:
+    module = "python_calamine" if engine == "calamine" else engine
+    return importlib.util.find_spec(module) is not None
+
+
+def get_excel_engine(engine: str | None = None) -> str:
+    """
+    Get the engine used to read Excel files: `engine` if given, otherwise
+    the one set by the `EXCEL_ENGINE` environment variable. Falls back to
+    openpyxl if calamine is not installed.
+    """
+    engine = engine or EXCEL_ENGINE
+    if engine not in EXCEL_ENGINES:
+        msg = f"Excel engine '{engine}' not supported, must be one of: {EXCEL_ENGINES}."
+        raise ValueError(msg)
+    if not _available(engine):
+        warnings.warn(f"Excel engine '{engine}' is not installed, using openpyxl.")
+        engine = "openpyxl"
+    return engine
+
+
+def read_excel(source, engine: str | None = None, **kwargs) -> pd.DataFrame:
+    """
+    Read the first sheet of an Excel file with the configured engine.
+    `source` is a path or a file-like object, and `kwargs` are passed
+    to `pd.read_excel`. Timed as the "read" stage of an upload.
+    """
+    with stage("read"):
+        return pd.read_excel(source, engine=get_excel_engine(engine), **kwargs)
@@ -0,0 +1,106 @@
+from datetime import date, timedelta
+
+from sqlalchemy import Date, delete, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from dimensions import get_dimensions
+from metrics import count_rows
+from models import DailySchedule, Grade, MonthlyGroupPlan, MonthlyScheduleRollup
+
+
+def _next_month(month: date) -> date:
+    return (month.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def refresh_schedule_rollup(db: Session, months):
+    """
+    Recompute the rows of the 'monthly_schedule_rollup' table for the
+    given months (first days of the month), from the heats scheduled in
+    those months in the 'daily_schedule' table. Each month is read through
+    the (date, time_start) index. Does not commit, so that it runs in the
+    transaction of the caller.
+    """
+    for month in sorted(set(months)):
+        heats = (
+            select(
+                literal(month, Date),
+                DailySchedule.grade_id,
+                func.count(DailySchedule.id),
+            )
+            .where(DailySchedule.date >= month, DailySchedule.date < _next_month(month))
+            .group_by(DailySchedule.grade_id)
+        )
+        db.execute(
+            delete(MonthlyScheduleRollup).where(MonthlyScheduleRollup.month == month)
+        )
+        db.execute(
+            insert(MonthlyScheduleRollup).from_select(
+                ["month", "grade_id", "heats"], heats
+            )
+        )
+
+
+def schedule_rollup(
+    db: Session, start_month: date | None = None, end_month: date | None = None
+) -> dict:
+    """
+    Heats scheduled per month, group and grade, from the rollup table,
+    compared with the heats planned for each group in the
+    'monthly_group_plan' table. Only months with scheduled heats are
+    returned, optionally from `start_month` to `end_month` (inclusive).
+    The queries read one row per month and grade (or group), not per heat.
+    """
+    query = (
+        select(
+            MonthlyScheduleRollup.month,
+            Grade.group_id,
+            Grade.name,
+            MonthlyScheduleRollup.heats,
+        )
+        .join(Grade, Grade.id == MonthlyScheduleRollup.grade_id)
+        .order_by(MonthlyScheduleRollup.month, Grade.group_id, Grade.name)
+    )
+    if start_month:
+        query = query.where(MonthlyScheduleRollup.month >= start_month)
+    if end_month:
+        query = query.where(MonthlyScheduleRollup.month <= end_month)
+    scheduled = db.execute(query).all()
+    months = sorted({month for month, *_ in scheduled})
+
+    plans = db.execute(
+        select(
+            MonthlyGroupPlan.month, MonthlyGroupPlan.group_id, MonthlyGroupPlan.heats
+        )
+        .where(MonthlyGroupPlan.month.in_(months))
+        .order_by(MonthlyGroupPlan.month, MonthlyGroupPlan.group_id)
+    ).all()
+    count_rows(len(scheduled) + len(plans))
+    group_names = get_dimensions(db).group_names
+
+    # (month, group id) -> planned and scheduled heats of the group
+    groups = {}
+    for month, group_id, heats in plans:
+        groups[month, group_id] = {"planned_heats": heats, "grades": {}}
+    for month, group_id, grade, heats in scheduled:
+        group = groups.setdefault(
+            (month, group_id), {"planned_heats": None, "grades": {}}
+        )
+        group["grades"][grade] = heats
+
+    # groups ordered by id within each month, with ungrouped grades last
+    order = sorted(groups, key=lambda key: (key[0], key[1] is None, key[1] or 0))
+    result = {month.strftime("%Y-%m"): [] for month in months}
+    for month, group_id in order:
+        group = groups[month, group_id]
+        planned = group["planned_heats"]
+        scheduled_heats = sum(group["grades"].values())
+        result[month.strftime("%Y-%m")].append(
+            {
+                "group": group_names.get(group_id),
+                "planned_heats": planned,
+                "scheduled_heats": scheduled_heats,
+                "variance": None if planned is None else scheduled_heats - planned,
+                "grades": group["grades"],
+            }
+        )
+    return result
@@ -1,40 +1,141 @@
+import csv
+import json
+import time
+from io import BytesIO
+
+import pandas as pd
+import pyarrow as pa
 import requests
 
 
-def upload_excel(file_path: str, base_url: str = "http://localhost:8000"):
-    """Upload an Excel file (.xlsx) to the database."""
+def upload_excel(
+    file_path: str,
+    base_url: str = "http://localhost:8000",
+    wait: bool = True,
+    timeout: float | None = None,
+    replace: bool = False,
+):
+    """
+    Upload an Excel file (.xlsx) to the database. Uploads are processed
+    in the background: if `wait` is True, wait until the upload job is
+    done and return the response with its final status, otherwise return
+    the response with the id of the queued job. With `replace`, a daily
+    charge schedule replaces the stored schedule of the days it covers.
+    """
 
     url = f"{base_url}/upload"
     with open(file_path, "rb") as f:
         files = {"file": (file_path, f)}
-        response = requests.post(url, files=files)
+        response = requests.post(url, files=files, params={"replace": replace})
+    if wait and response.status_code == 202:
+        response = wait_for_job(response.json()["id"], base_url, timeout=timeout)
+    return response
+
+
+def upload_batch(
+    file_paths: list[str],
+    base_url: str = "http://localhost:8000",
+    replace: bool = False,
+):
+    """
+    Upload several Excel files (.xlsx), and/or .zip archives of Excel
+    files, to the database in a single transaction. The response holds
+    a report with the status and timings of each file. With `replace`,
+    the daily charge schedules replace the stored schedule of the days
+    they cover.
+    """
+
+    url = f"{base_url}/upload/batch"
+    handles = [open(file_path, "rb") for file_path in file_paths]
+    try:
+        files = [("files", (file_path, f)) for file_path, f in zip(file_paths, handles)]
+        response = requests.post(url, files=files, params={"replace": replace})
+    finally:
+        for f in handles:
+            f.close()
     return response
 
 
+def wait_for_job(
+    job_id: str,
+    base_url: str = "http://localhost:8000",
+    poll_interval: float = 0.5,
+    timeout: float | None = None,
+):
+    """
+    Poll the status of an upload job until it has succeeded, failed or
+    was skipped as unchanged, and return the last response. Raises
+    `TimeoutError` if the job is not done after `timeout` seconds.
+    """
+
+    url = f"{base_url}/jobs/{job_id}"
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        response = requests.get(url)
+        if response.status_code != 200:
+            return response
+        if response.json()["status"] in ("succeeded", "failed", "unchanged"):
+            return response
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError(f"Upload job {job_id} not done after {timeout}s.")
+        time.sleep(poll_interval)
+
+
 def get_forecast(
     base_url: str = "http://localhost:8000",
+    model: str = "mean",
+    months: list[str] | None = None,
+    horizon: int | None = None,
 ):
     """
-    Get the grade-level production forecast for next month.
+    Get the grade-level production forecast for next month, with the
+    given forecasting model: mean, ewma, trailing or seasonal. To forecast
+    several months, give either the planned `months` (YYYY-MM), or a
+    `horizon` to forecast up to that number of planned months without
+    production data.
     """
 
     url = f"{base_url}/forecast"
-    response = requests.get(url)
+    params = {"model": model, "horizon": horizon}
+    if months is not None:
+        params["months"] = ",".join(months)
+    response = requests.get(url, params=params)
     return response
 
 
-def get_db_table(table: str, base_url: str = "http://localhost:8000"):
+def get_forecast_backtest(
+    base_url: str = "http://localhost:8000",
+):
+    """
+    Get the accuracy of the forecast over the historical months, as the
+    MAE and MAPE overall, per product group and per steel grade.
     """
-    Fetch all entries from the specified database table.
 
-    Supported tables:
-        - groups: product groups
-        - grades: steel grades
-        - daily_schedules: daily production schedules of steel grades
-        - monthly_plans: monthly production plans of heats per product group
-        - monthly_breakdown: monthly production breakdown of tons per steel grade
+    url = f"{base_url}/forecast/backtest"
+    response = requests.get(url)
+    return response
+
+
+def get_schedule_rollup(
+    base_url: str = "http://localhost:8000",
+    start_month: str | None = None,
+    end_month: str | None = None,
+):
+    """
+    Get the heats scheduled per month, product group and steel grade,
+    compared with the monthly plan of each group. Months are given as
+    YYYY-MM.
     """
 
+    url = f"{base_url}/daily_schedules/rollup"
+    params = {"start_month": start_month, "end_month": end_month}
+    response = requests.get(url, params=params)
+    return response
+
+
+def _table_url(table: str, base_url: str) -> str:
+    """Get the URL of the endpoint serving the specified database table."""
+
     supported_tables = [
         "groups",
         "grades",
@@ -56,6 +157,83 @@ def get_db_table(table: str, base_url: str = "http://localhost:8000"):
     else:
         msg = f"Table '{table}' not supported, must be one of: {supported_tables}."
         raise ValueError(msg)
-    response = requests.get(url)
+    return url
+
+
+def get_db_table(
+    table: str, base_url: str = "http://localhost:8000", params: dict | None = None
+):
+    """
+    Fetch all entries from the specified database table. Optional query
+    `params` are passed to the endpoint, e.g. `start_date`, `end_date`,
+    `cursor` and `limit` for the daily schedules.
+
+    Supported tables:
+        - groups: product groups
+        - grades: steel grades
+        - daily_schedules: daily production schedules of steel grades
+        - monthly_plans: monthly production plans of heats per product group
+        - monthly_breakdown: monthly production breakdown of tons per steel grade
+    """
+
+    url = _table_url(table, base_url)
+    response = requests.get(url, params=params)
 
     return response
+
+
+def get_dataframe(
+    table: str,
+    base_url: str = "http://localhost:8000",
+    params: dict | None = None,
+    format: str = "arrow",
+) -> pd.DataFrame:
+    """
+    Fetch a large database table as a `pandas.DataFrame`, transferred in
+    the columnar `arrow` (IPC stream) or `parquet` format, with the types
+    of its columns: dates as dates, and numbers as integers. The columns
+    are backed by the Arrow arrays of the payload (`pd.ArrowDtype`), so
+    that no data is copied to build the DataFrame.
+
+    Supported tables: daily_schedules, monthly_plans, monthly_breakdown.
+    """
+
+    if format not in ("arrow", "parquet"):
+        raise ValueError(f"Format '{format}' not supported, must be arrow or parquet.")
+    url = _table_url(table, base_url)
+    params = {**(params or {}), "format": format}
+    response = requests.get(url, params=params)
+    response.raise_for_status()
+    if format == "parquet":
+        return pd.read_parquet(BytesIO(response.content), dtype_backend="pyarrow")
+    with pa.ipc.open_stream(pa.py_buffer(response.content)) as reader:
+        return reader.read_all().to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def stream_db_table(
+    table: str,
+    base_url: str = "http://localhost:8000",
+    params: dict | None = None,
+    format: str = "ndjson",
+):
+    """
+    Iterate over the entries of a large database table one row at a time,
+    as the server streams them in `ndjson` or `csv` format, instead of
+    loading the whole response in memory. Yields one dict per row.
+
+    Supported tables: daily_schedules, monthly_plans, monthly_breakdown.
+    """
+
+    if format not in ("ndjson", "csv"):
+        raise ValueError(f"Format '{format}' not supported, must be ndjson or csv.")
+    url = _table_url(table, base_url)
+    params = {**(params or {}), "format": format}
+    with requests.get(url, params=params, stream=True) as response:
+        response.raise_for_status()
+        lines = response.iter_lines(decode_unicode=True)
+        if format == "ndjson":
+            for line in lines:
+                if line:
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(lines)